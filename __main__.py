@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The application modules import each other as top-level packages (utils,
+# processing), so the project directory must be importable under `python -m`.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
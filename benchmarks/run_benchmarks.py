@@ -0,0 +1,189 @@
+"""
+Times every stage of the extraction pipeline on a synthetic, reproducible corpus.
+
+Run from the project directory:
+
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json   # compare with an earlier run
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from PIL import Image
+
+from benchmarks.synthetic_documents import generate_corpus
+from processing.image_processor import ImageProcessor
+from processing.metrics import CallMetrics
+from utils.document_handler import iter_images_from_document
+
+def _percentile(values, pct):
+    return float(np.percentile(values, pct)) if values else 0.0
+
+def measure_stage(func, items, repeats=1):
+    """
+    Calls `func` on every item `repeats` times and reports latency percentiles,
+    throughput, and the tracemalloc peak of a separate, untimed pass.
+    """
+    latencies = []
+    started_at = time.perf_counter()
+    for _ in range(repeats):
+        for item in items:
+            call_started_at = time.perf_counter()
+            func(item)
+            latencies.append(time.perf_counter() - call_started_at)
+    wall_seconds = time.perf_counter() - started_at
+
+    # Memory is measured apart from timing, as tracing slows allocations down.
+    tracemalloc.start()
+    for item in items:
+        func(item)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "calls": len(latencies),
+        "total_s": round(wall_seconds, 6),
+        "throughput_per_s": round(len(latencies) / wall_seconds, 3) if wall_seconds else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+        "mean_ms": round(float(np.mean(latencies)) * 1000, 3) if latencies else 0.0,
+        "peak_memory_mb": round(peak_bytes / (1024 * 1024), 3),
+    }
+
+def _optional_side(value):
+    """argparse type for a pixel limit where 0 or 'none' turns the limit off."""
+    if value.lower() in ("0", "none"):
+        return None
+    side = int(value)
+    if side < 0:
+        raise argparse.ArgumentTypeError("must be a positive number of pixels, 0 or 'none'")
+    return side
+
+def _load_rgb(path):
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGB"))
+
+def run(args):
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="image_extractor_bench_")
+    print(f"Generating synthetic corpus in '{corpus_dir}' (seed {args.seed})...")
+    corpus = generate_corpus(corpus_dir, seed=args.seed, pages=args.pages, dpis=tuple(args.dpi))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+            "seed": args.seed,
+            "pages": args.pages,
+            "dpi": args.dpi,
+            "repeats": args.repeats,
+            "backend": args.backend,
+            "draft_max_side": args.draft_max_side,
+            "detection_max_side": args.detection_max_side,
+        },
+        "stages": {},
+    }
+    stages = report["stages"]
+
+    documents = corpus["pdfs"] + corpus["docx"]
+    stages["document_extraction"] = measure_stage(
+        lambda path: [item.image.load() for item in iter_images_from_document(path)], documents, args.repeats
+    )
+
+    page_images = [_load_rgb(path) for path in corpus["images"]]
+    stages["decode"] = measure_stage(_load_rgb, corpus["images"], args.repeats)
+
+    processor = ImageProcessor(backend=args.backend, detection_max_side=args.detection_max_side,
+                               draft_max_side=args.draft_max_side, validation_image_size=args.validation_imgsz,
+                               crop_image_size=args.crop_imgsz)
+    processor.warm_up()
+
+    stages["shape_finding"] = measure_stage(processor._find_candidate_quads, page_images, args.repeats)
+
+    # Inputs for the later stages come from the earlier ones, computed once, untimed.
+    candidate_crops, quads = [], []
+    for image_rgb in page_images:
+        for approx, (x, y, w, h) in processor._find_candidate_quads(image_rgb):
+            candidate_crops.append(Image.fromarray(image_rgb[y:y + h, x:x + w]))
+            quads.append((image_rgb, approx))
+
+    stages["validation_inference"] = measure_stage(
+        lambda crop: processor.backend.predict([crop], processor.validation_confidence, processor.validation_image_size),
+        candidate_crops, args.repeats
+    )
+    stages["validation_inference_batched"] = measure_stage(
+        lambda crops: processor.backend.predict(crops, processor.validation_confidence, processor.validation_image_size),
+        [candidate_crops[i:i + processor.validation_batch_size]
+         for i in range(0, len(candidate_crops), processor.validation_batch_size)],
+        args.repeats
+    )
+
+    warped_photos = [Image.fromarray(processor._warp_quad(image_rgb, approx)[0]) for image_rgb, approx in quads]
+    stages["warp"] = measure_stage(lambda quad: processor._warp_quad(*quad), quads, args.repeats)
+    # The final crop is timed in two parts: the model call locating the face on the
+    # straightened photo, and the geometric crop around the box it returns.
+    stages["crop_inference"] = measure_stage(
+        lambda photo: processor._detect_face(photo, CallMetrics()), warped_photos, args.repeats
+    )
+    face_boxes = [(photo, processor._detect_face(photo, CallMetrics())) for photo in warped_photos]
+    face_boxes = [(photo, box) for photo, box in face_boxes if box is not None]
+    stages["crop_geometry"] = measure_stage(
+        lambda item: processor._crop_around_face(item[0], item[1], CallMetrics()), face_boxes, args.repeats
+    )
+    stages["end_to_end"] = measure_stage(processor.extract_photo, corpus["images"], args.repeats)
+
+    return report
+
+def compare(report, baseline):
+    """Prints the relative change of each stage's p50 latency against a baseline report."""
+    print(f"\n{'stage':32} {'p50 ms':>10} {'baseline':>10} {'change':>8}")
+    for stage, stats in report["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or not old.get("p50_ms"):
+            print(f"{stage:32} {stats['p50_ms']:>10.2f} {'-':>10} {'-':>8}")
+            continue
+        change = (stats["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+        print(f"{stage:32} {stats['p50_ms']:>10.2f} {old['p50_ms']:>10.2f} {change:>+7.1f}%")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the extraction pipeline.")
+    parser.add_argument("--output", help="Write the JSON report to this file.")
+    parser.add_argument("--baseline", help="A previous JSON report to compare against.")
+    parser.add_argument("--corpus-dir", help="Where to write the synthetic corpus (default: a temp directory).")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--pages", type=int, default=6, help="Pages generated per DPI.")
+    parser.add_argument("--dpi", type=int, nargs="+", default=[150, 300])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--backend", default="torch", choices=("torch", "onnx", "openvino"))
+    parser.add_argument("--detection-max-side", type=_optional_side, default=1600,
+                        help="Longest side of the copy searched for photo shapes; 0 or 'none' searches at full resolution.")
+    parser.add_argument("--draft-max-side", type=int, default=None)
+    parser.add_argument("--validation-imgsz", type=int, default=None)
+    parser.add_argument("--crop-imgsz", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Report written to '{args.output}'.")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
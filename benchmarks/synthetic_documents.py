@@ -0,0 +1,154 @@
+import io
+import os
+import random
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+A4_INCHES = (8.27, 11.69)
+SAMPLE_PORTRAIT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples",
+                               "sample resume_img_extracted.jpg")
+
+def make_portrait(size, rng):
+    """
+    Returns a square RGB portrait of the given size. The sample headshot shipped
+    with the repository is used when available, so the detector has a real face
+    to find; otherwise a simple drawn head is used.
+    """
+    if os.path.exists(SAMPLE_PORTRAIT):
+        portrait = Image.open(SAMPLE_PORTRAIT).convert("RGB").resize((size, size), Image.LANCZOS)
+    else:
+        portrait = Image.new("RGB", (size, size), (200, 210, 225))
+        draw = ImageDraw.Draw(portrait)
+        draw.ellipse([size * 0.3, size * 0.15, size * 0.7, size * 0.6], fill=(224, 172, 140))
+        draw.rectangle([size * 0.15, size * 0.65, size * 0.85, size], fill=(40, 60, 90))
+
+    # Slight, seeded colour variation so repeated portraits are not byte-identical.
+    shift = np.array([rng.randint(-12, 12) for _ in range(3)], dtype=np.int16)
+    pixels = np.clip(np.asarray(portrait, dtype=np.int16) + shift, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels)
+
+def _paste_skewed(page, photo, origin, rotation, skew):
+    """Pastes a photo onto the page with a rotation and a perspective skew applied."""
+    photo_cv = cv2.cvtColor(np.asarray(photo), cv2.COLOR_RGB2BGR)
+    h, w = photo_cv.shape[:2]
+    offset = skew * w
+    src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    dst = np.float32([[offset, 0], [w - offset / 2, offset], [w, h], [0, h - offset]])
+
+    angle = np.deg2rad(rotation)
+    center = np.float32([w / 2, h / 2])
+    rot = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]], dtype=np.float32)
+    dst = (dst - center) @ rot.T + center
+
+    min_xy = dst.min(axis=0)
+    dst -= min_xy
+    out_w, out_h = int(np.ceil(dst[:, 0].max())), int(np.ceil(dst[:, 1].max()))
+
+    M = cv2.getPerspectiveTransform(src, dst)
+    warped = cv2.warpPerspective(photo_cv, M, (out_w, out_h))
+    mask = cv2.warpPerspective(np.full((h, w), 255, np.uint8), M, (out_w, out_h))
+
+    page.paste(Image.fromarray(cv2.cvtColor(warped, cv2.COLOR_BGR2RGB)), origin, Image.fromarray(mask))
+
+def make_scan_page(dpi, rng, photos=1, max_rotation=8.0, max_skew=0.06):
+    """
+    Generates an A4 'scanned' page at the given DPI: text-like lines, a header
+    bar, paper noise and one or more portraits with a border, each rotated
+    and skewed by a random amount.
+
+    Args:
+        dpi (int): Page resolution.
+        rng (random.Random): Source of randomness, for reproducible pages.
+        photos (int): Number of portraits placed on the page.
+        max_rotation (float): Maximum absolute rotation in degrees.
+        max_skew (float): Maximum perspective skew, as a fraction of the photo width.
+
+    Returns:
+        PIL.Image.Image: The page, in RGB.
+    """
+    page_w, page_h = int(A4_INCHES[0] * dpi), int(A4_INCHES[1] * dpi)
+    page = Image.new("RGB", (page_w, page_h), (250, 250, 247))
+    draw = ImageDraw.Draw(page)
+
+    draw.rectangle([int(0.5 * dpi), int(0.4 * dpi), page_w - int(0.5 * dpi), int(0.6 * dpi)], fill=(30, 30, 30))
+    line_h = max(2, int(0.06 * dpi))
+    y = int(0.9 * dpi)
+    while y < page_h - dpi:
+        x = int(3.0 * dpi)
+        while x < page_w - int(0.6 * dpi):
+            word_w = int(rng.uniform(0.2, 0.8) * dpi)
+            draw.rectangle([x, y, min(x + word_w, page_w - int(0.6 * dpi)), y + line_h], fill=(60, 60, 60))
+            x += word_w + int(0.08 * dpi)
+        y += int(0.22 * dpi)
+
+    photo_size = int(1.6 * dpi)
+    for i in range(photos):
+        portrait = make_portrait(photo_size, rng)
+        bordered = Image.new("RGB", (photo_size + 8, photo_size + 8), (20, 20, 20))
+        bordered.paste(portrait, (4, 4))
+        origin = (int(0.5 * dpi), int((1.0 + i * 2.2) * dpi))
+        _paste_skewed(page, bordered, origin, rng.uniform(-max_rotation, max_rotation), rng.uniform(0, max_skew))
+
+    noise = np.random.default_rng(rng.randint(0, 2 ** 31)).integers(-6, 7, size=(page_h, page_w, 1), dtype=np.int16)
+    pixels = np.clip(np.asarray(page, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels)
+
+def _jpeg_bytes(image, quality=90):
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+def write_pdf(pages, path):
+    """Writes pages into a PDF as embedded JPEG page images, like a scanner would."""
+    import fitz
+    doc = fitz.open()
+    for page_image in pages:
+        width_pt = page_image.width * 72.0 / page_image.info.get("dpi", (150, 150))[0]
+        height_pt = page_image.height * 72.0 / page_image.info.get("dpi", (150, 150))[1]
+        page = doc.new_page(width=width_pt, height=height_pt)
+        page.insert_image(page.rect, stream=_jpeg_bytes(page_image))
+    doc.save(path)
+    doc.close()
+
+def write_docx(images, path):
+    """Writes images into a Word document, one per paragraph."""
+    from docx import Document
+    from docx.shared import Inches
+    document = Document()
+    for image in images:
+        document.add_paragraph("Applicant photo")
+        document.add_picture(io.BytesIO(_jpeg_bytes(image)), width=Inches(2.0))
+    document.save(path)
+
+def generate_corpus(output_dir, seed=1234, pages=6, dpis=(150, 300)):
+    """
+    Generates a reproducible set of synthetic inputs in `output_dir`: single page
+    images at every DPI, a multi-page PDF per DPI and a DOCX with loose portraits.
+
+    Returns:
+        dict: Lists of generated paths under 'images', 'pdfs' and 'docx'.
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    corpus = {"images": [], "pdfs": [], "docx": []}
+
+    for dpi in dpis:
+        page_images = []
+        for i in range(pages):
+            page = make_scan_page(dpi, rng, photos=1 + (i % 2))
+            page.info["dpi"] = (dpi, dpi)
+            page_images.append(page)
+            image_path = os.path.join(output_dir, f"scan_{dpi}dpi_{i + 1}.jpg")
+            page.save(image_path, "JPEG", quality=90, dpi=(dpi, dpi))
+            corpus["images"].append(image_path)
+
+        pdf_path = os.path.join(output_dir, f"document_{dpi}dpi.pdf")
+        write_pdf(page_images, pdf_path)
+        corpus["pdfs"].append(pdf_path)
+
+    docx_path = os.path.join(output_dir, "document.docx")
+    write_docx([make_portrait(600, rng) for _ in range(pages)], docx_path)
+    corpus["docx"].append(docx_path)
+
+    return corpus
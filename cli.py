@@ -0,0 +1,180 @@
+import argparse
+import os
+import sys
+from concurrent.futures.process import BrokenProcessPool
+from utils.logging_config import setup_console_logging, log_message
+
+def add_processing_arguments(parser):
+    """Adds the model, decoding and document options shared by the batch and serve commands."""
+    parser.add_argument("--dpi", type=int, default=200,
+                        help="Resolution used to render PDF pages without embedded images.")
+    parser.add_argument("--render-workers", type=int, default=1,
+                        help="Number of processes rendering the pages of each PDF.")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Directory of a persistent result cache (disabled by default).")
+    parser.add_argument("--cache-size-mb", type=int, default=512,
+                        help="Maximum size of the result cache before old entries are evicted.")
+    parser.add_argument("--backend", choices=("torch", "onnx", "openvino"), default="torch",
+                        help="Inference backend. onnx and openvino convert the model once and cache it next to model.pt.")
+    parser.add_argument("--int8", action="store_true",
+                        help="Use an INT8-quantized model (onnx and openvino backends only).")
+    parser.add_argument("--calibration-data", default=None,
+                        help="Dataset YAML or image directory used to calibrate INT8 quantization "
+                             "(required for onnx).")
+    parser.add_argument("--draft-max-side", type=int, default=None,
+                        help="Decode JPEG files larger than this at a reduced scale for detection; "
+                             "portraits are still cut from the full-resolution file.")
+    parser.add_argument("--memory-budget-mb", type=int, default=None,
+                        help="Memory one image may use; larger scans are processed on a downsampled view.")
+    parser.add_argument("--validation-imgsz", type=int, default=None,
+                        help="Model input size when checking photo candidates for a face (default: 640); "
+                             "e.g. 320 cuts most of the model time.")
+    parser.add_argument("--validation-conf", type=float, default=None,
+                        help="Confidence threshold when checking photo candidates for a face (default: 0.25).")
+    parser.add_argument("--crop-imgsz", type=int, default=None,
+                        help="Model input size of the face detection the portrait is cropped around (default: 640).")
+    parser.add_argument("--crop-conf", type=float, default=None,
+                        help="Confidence threshold of the face detection the portrait is cropped around (default: 0.25).")
+    parser.add_argument("--no-prefilter", action="store_true",
+                        help="Send every document image to the model, including logos, icons and signatures.")
+    parser.add_argument("--min-image-side", type=int, default=40,
+                        help="Document images narrower or shorter than this many pixels are skipped.")
+    parser.add_argument("--shape-workers", type=int, default=1,
+                        help="Threads running the contour search of document images.")
+    parser.add_argument("--inference-workers", type=int, default=1,
+                        help="Threads running the model (keep 1 for the torch backend).")
+    parser.add_argument("--crop-workers", type=int, default=1,
+                        help="Threads cutting the portraits.")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="Images buffered between two pipeline stages.")
+
+def processing_kwargs(args):
+    """Returns the (processor_kwargs, document_kwargs, pipeline_kwargs) selected by add_processing_arguments."""
+    from utils.image_prefilter import ImagePrefilter
+
+    document_kwargs = {"render_dpi": args.dpi, "render_workers": args.render_workers}
+    if not args.no_prefilter:
+        document_kwargs["prefilter"] = ImagePrefilter(min_pixel_side=args.min_image_side)
+    processor_kwargs = {"backend": args.backend, "int8": args.int8, "calibration_data": args.calibration_data,
+                        "draft_max_side": args.draft_max_side, "memory_budget_mb": args.memory_budget_mb,
+                        "validation_image_size": args.validation_imgsz, "validation_confidence": args.validation_conf,
+                        "crop_image_size": args.crop_imgsz, "crop_confidence": args.crop_conf}
+    if args.cache_dir:
+        processor_kwargs.update(cache_dir=args.cache_dir, cache_max_bytes=args.cache_size_mb * 1024 * 1024)
+    pipeline_kwargs = {"shape_workers": args.shape_workers, "inference_workers": args.inference_workers,
+                       "crop_workers": args.crop_workers, "queue_size": args.queue_size}
+    return processor_kwargs, document_kwargs, pipeline_kwargs
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="image_extractor",
+        description="Extract portrait photos from images, PDFs and Word documents."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="Process every supported file in a directory without the GUI."
+    )
+    batch_parser.add_argument("input_dir", help="Directory to scan (recursively) for images, PDFs and DOCX files.")
+    batch_parser.add_argument("output_dir", help="Directory the extracted portraits are written to.")
+    batch_parser.add_argument("--workers", type=int, default=None,
+                              help="Number of worker processes (default: number of CPUs).")
+    batch_parser.add_argument("--threads-per-worker", type=int, default=None,
+                              help="Intra-op threads of each worker's model (default: the CPU cores divided by --workers).")
+    batch_parser.add_argument("--quality", type=int, default=95, help="JPEG quality of the saved portraits.")
+    add_processing_arguments(batch_parser)
+    batch_parser.add_argument("--encode-workers", type=int, default=1,
+                              help="Threads per worker process encoding the portraits to JPEG.")
+    batch_parser.add_argument("--all-faces", action="store_true",
+                              help="Save every portrait found on each image (e.g. sheets of ID photos), not just one.")
+    batch_parser.add_argument("--metrics-out", default=None,
+                              help="Write per-stage timing histograms and counters to this file when done.")
+    batch_parser.add_argument("--metrics-format", choices=("prometheus", "jsonl"), default="prometheus",
+                              help="Format of the --metrics-out file.")
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Run a local HTTP service that keeps the model loaded between requests."
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: localhost only).")
+    serve_parser.add_argument("--port", type=int, default=8765, help="Port to listen on.")
+    serve_parser.add_argument("--models", type=int, default=1,
+                              help="Number of resident models; requests are spread over them.")
+    serve_parser.add_argument("--max-batch-size", type=int, default=8,
+                              help="Images per model call above which a micro-batch runs without waiting.")
+    serve_parser.add_argument("--max-wait-ms", type=float, default=10,
+                              help="Longest time a model call waits for concurrent requests to join its batch.")
+    serve_parser.add_argument("--threads-per-model", type=int, default=None,
+                              help="Intra-op threads of each model (default: the CPU cores divided by --models).")
+    serve_parser.add_argument("--max-upload-mb", type=int, default=50, help="Largest accepted upload.")
+    serve_parser.add_argument("--quality", type=int, default=95, help="Default JPEG quality of the returned portraits.")
+    add_processing_arguments(serve_parser)
+
+    return parser
+
+def run_batch_command(args):
+    # Imported here so that `--help` and argument errors do not pay for loading the model stack.
+    from processing.batch import run_batch
+    from processing.metrics import MetricsRegistry
+
+    if not os.path.isdir(args.input_dir):
+        log_message(f"Input directory not found: {args.input_dir}", "error")
+        return 2
+
+    try:
+        processor_kwargs, document_kwargs, pipeline_kwargs = processing_kwargs(args)
+        pipeline_kwargs["encode_workers"] = args.encode_workers
+        metrics = MetricsRegistry() if args.metrics_out else None
+        summary = run_batch(args.input_dir, args.output_dir, workers=args.workers, jpeg_quality=args.quality,
+                            processor_kwargs=processor_kwargs, document_kwargs=document_kwargs, metrics=metrics,
+                            all_faces=args.all_faces, pipeline_kwargs=pipeline_kwargs,
+                            threads_per_worker=args.threads_per_worker)
+    except BrokenProcessPool as e:
+        log_message(f"A worker process failed to start or crashed: {e}", "error")
+        return 1
+
+    if metrics is not None:
+        try:
+            metrics.write(args.metrics_out, args.metrics_format)
+            log_message(f"Metrics written to '{args.metrics_out}'.")
+        except OSError as e:
+            log_message(f"Could not write metrics to '{args.metrics_out}': {e}", "error")
+
+    log_message(
+        f"Batch complete: {summary['files']} file(s), {summary['portraits']} portrait(s) saved, "
+        f"{summary['failed']} failure(s)."
+    )
+    return 1 if summary["failed"] else 0
+
+def run_serve_command(args):
+    from processing.server import ExtractionService, run_server
+
+    processor_kwargs, document_kwargs, pipeline_kwargs = processing_kwargs(args)
+    log_message(f"Loading {args.models} model(s)...")
+    try:
+        service = ExtractionService(processor_kwargs, models=args.models, max_batch_size=args.max_batch_size,
+                                    max_wait_ms=args.max_wait_ms, document_kwargs=document_kwargs,
+                                    pipeline_kwargs=pipeline_kwargs, threads_per_model=args.threads_per_model)
+    except Exception as e:
+        log_message(f"Could not load the model: {e}", "error")
+        return 1
+
+    try:
+        run_server(service, args.host, args.port, jpeg_quality=args.quality, max_upload_mb=args.max_upload_mb)
+    except OSError as e:
+        service.close()
+        log_message(f"Could not listen on {args.host}:{args.port}: {e}", "error")
+        return 1
+    return 0
+
+def main(argv=None):
+    setup_console_logging()
+    args = build_parser().parse_args(argv)
+
+    if args.command == "batch":
+        return run_batch_command(args)
+    if args.command == "serve":
+        return run_serve_command(args)
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,22 @@
+import time
+# Taken before any other import, so the reported startup time covers them too.
+STARTUP_STARTED_AT = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 import threading
 import os
 import sys
 import webbrowser
 import subprocess
+from contextlib import contextmanager, ExitStack
 from utils.logging_config import setup_logging, log_message
-from processing.image_processor import ImageProcessor
-from utils.document_handler import extract_images_from_document
+from utils.file_types import IMAGE_EXTENSIONS, DOCUMENT_EXTENSIONS
+from utils.file_naming import build_portrait_filename
+from processing.metrics import MetricsRegistry
+from processing.cancellation import CancellationToken, OperationCancelled
+# The model stack (ultralytics, torch, OpenCV) and the document libraries are
+# imported on first use, so the window appears before they are loaded.
 from PIL import Image, ImageTk, ImageDraw
 
 class ImageExtractorApp:
@@ -32,6 +41,14 @@ class ImageExtractorApp:
 
         self.always_on_top_var = tk.BooleanVar()
         self.show_logs_var = tk.BooleanVar(value=True)
+        self.backend_var = tk.StringVar(value="torch")
+        self.int8_var = tk.BooleanVar(value=False)
+        self.all_faces_var = tk.BooleanVar(value=False)
+        self.prefilter_var = tk.BooleanVar(value=True)
+        self.cache_results_var = tk.BooleanVar(value=False)
+        self.export_format_var = tk.StringVar(value="jpeg")
+        self.export_size_var = tk.IntVar(value=0)
+        self.export_zip_var = tk.BooleanVar(value=False)
 
         self.load_menu_icons()
         self.create_menu_bar()
@@ -59,16 +76,46 @@ class ImageExtractorApp:
                                 bg="white", fg="black", relief=tk.SOLID, borderwidth=1)
         self.log_text.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=5, pady=5)
 
+        progress_panel = ttk.Frame(main_frame)
+        progress_panel.pack(fill=tk.X, pady=(5, 0))
+        self.progress_bar = ttk.Progressbar(progress_panel, mode="determinate", maximum=1.0)
+        self.progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.cancel_button = ttk.Button(progress_panel, text="Cancel", command=self.cancel_processing, state="disabled")
+        self.cancel_button.pack(side=tk.RIGHT, padx=5)
+
         self.status_bar = ttk.Label(main_frame, text="Ready", anchor=tk.W)
         self.status_bar.pack(fill=tk.X, pady=5)
 
-        self.image_processor = None
+        # Loaded models are handed out per job; reloading swaps them once running jobs finish.
+        self.processor_pool = None
+        self.document_engine = None
+        # Held while a job picks up the engine and while a new engine is swapped in.
+        self.engine_lock = threading.Lock()
+        # Each worker process holds its own model, on top of the pool's, so extra workers
+        # are opt-in (Tools > Set Worker Processes...) rather than one per core at launch.
+        self.worker_count = 1
+        # The on-disk result cache keeps portraits of every processed file, so it is
+        # opt-in (Tools > Cache Results on Disk).
+        self.processor_kwargs = {}
+        # Per-stage timings of every extraction in this session, from this process and the workers.
+        self.metrics = MetricsRegistry()
         self.source_filepath = None
         self.extracted_portraits = []
-
-        setup_logging(self.log_text)
+        # Token of the file being processed; cancelled when the user abandons it.
+        self.cancel_token = None
+        self.export_quality = 95
+        self.export_running = False
+        self.processing_started_at = None
+        self.first_result_reported = False
+
+        # The panel shows the latest lines only; the full log is kept in a rotating file.
+        setup_logging(self.log_text, log_file=os.path.abspath(os.path.join(os.path.dirname(__file__), "data", "logs", "image_extractor.log")))
+        self.root.after_idle(self.report_startup_time)
         self.initialize_processor()
 
+    def report_startup_time(self):
+        log_message(f"Window ready {time.perf_counter() - STARTUP_STARTED_AT:.2f}s after launch.")
+
     # ... (All other methods like load_menu_icons, create_menu_bar, etc. are unchanged) ...
     # ... They are included at the end for the full file. ...
 
@@ -229,6 +276,19 @@ All portraits successfully created from the source images are collected. If one
         menubar.add_cascade(label="File", menu=self.file_menu)
         self.file_menu.add_command(label="Open File...", accelerator="Ctrl+O", command=self.load_file)
         self.file_menu.add_command(label="Save Extracted Photos...", accelerator="Ctrl+S", command=self.save_images, state="disabled")
+        self.file_menu.add_command(label="Save All to Folder...", accelerator="Ctrl+Shift+S", command=self.save_all_to_folder, state="disabled")
+        export_menu = tk.Menu(self.file_menu, tearoff=0)
+        self.file_menu.add_cascade(label="Export Options", menu=export_menu)
+        export_menu.add_radiobutton(label="JPEG", value="jpeg", variable=self.export_format_var)
+        export_menu.add_radiobutton(label="WebP", value="webp", variable=self.export_format_var)
+        export_menu.add_radiobutton(label="PNG", value="png", variable=self.export_format_var)
+        export_menu.add_command(label="JPEG/WebP Quality...", command=self.set_export_quality)
+        export_menu.add_separator()
+        export_menu.add_radiobutton(label="Full Size", value=0, variable=self.export_size_var)
+        export_menu.add_radiobutton(label="Thumbnail (256 px)", value=256, variable=self.export_size_var)
+        export_menu.add_radiobutton(label="Thumbnail (128 px)", value=128, variable=self.export_size_var)
+        export_menu.add_separator()
+        export_menu.add_checkbutton(label="Save as a Single ZIP Archive", onvalue=True, offvalue=False, variable=self.export_zip_var)
         self.file_menu.add_separator()
         self.file_menu.add_command(label="Reset Session", accelerator="Ctrl+R", command=self.reset_session)
         self.file_menu.add_separator()
@@ -252,7 +312,19 @@ All portraits successfully created from the source images are collected. If one
         else:
             tools_menu.add_command(label="Open Model Folder...", command=self.open_model_folder)
         tools_menu.add_separator()
+        backend_menu = tk.Menu(tools_menu, tearoff=0)
+        tools_menu.add_cascade(label="Inference Backend", menu=backend_menu)
+        backend_menu.add_radiobutton(label="PyTorch (ultralytics)", value="torch", variable=self.backend_var, command=self.change_backend)
+        backend_menu.add_radiobutton(label="ONNX Runtime", value="onnx", variable=self.backend_var, command=self.change_backend)
+        backend_menu.add_radiobutton(label="OpenVINO", value="openvino", variable=self.backend_var, command=self.change_backend)
+        backend_menu.add_separator()
+        backend_menu.add_checkbutton(label="INT8 Quantization", onvalue=True, offvalue=False, variable=self.int8_var, command=self.change_backend)
+        tools_menu.add_checkbutton(label="Skip Logos, Icons and Signatures", onvalue=True, offvalue=False, variable=self.prefilter_var)
+        tools_menu.add_checkbutton(label="Extract All Faces per Image", onvalue=True, offvalue=False, variable=self.all_faces_var)
+        tools_menu.add_checkbutton(label="Cache Results on Disk", onvalue=True, offvalue=False, variable=self.cache_results_var, command=self.toggle_result_cache)
+        tools_menu.add_command(label="Set Worker Processes...", command=self.set_worker_count)
         tools_menu.add_command(label="Force Reload AI Model", command=self.force_reload_model)
+        tools_menu.add_command(label="Export Metrics...", command=self.export_metrics)
 
         help_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Help", menu=help_menu)
@@ -268,6 +340,7 @@ All portraits successfully created from the source images are collected. If one
 
         self.root.bind_all("<Control-o>", lambda event: self.load_file())
         self.root.bind_all("<Control-s>", lambda event: self.save_images())
+        self.root.bind_all("<Control-S>", lambda event: self.save_all_to_folder())
         self.root.bind_all("<Control-r>", lambda event: self.reset_session())
         self.root.bind_all("<Control-c>", lambda event: self.copy_logs())
         self.root.bind_all("<Shift-Delete>", lambda event: self.clear_logs())
@@ -291,7 +364,32 @@ All portraits successfully created from the source images are collected. If one
 
     def _load_processor(self):
         try:
-            self.image_processor = ImageProcessor()
+            load_started_at = time.perf_counter()
+            from processing.processor_pool import ProcessorPool
+            from processing.document_engine import DocumentEngine
+
+            processor_kwargs = {**self.processor_kwargs, "metrics_hooks": [self.metrics.observe]}
+            if self.processor_pool is None:
+                processor_pool = ProcessorPool(processor_kwargs, warm_up=False)
+                load_seconds = time.perf_counter() - load_started_at
+                warm_up_seconds = processor_pool.warm_up()
+                log_message(f"Model loaded in {load_seconds:.2f}s; warm-up inference took {warm_up_seconds:.2f}s.")
+                self.processor_pool = processor_pool
+            else:
+                # The current model keeps serving until the new one is ready; a file still
+                # being processed finishes on the old one.
+                self.processor_pool.reload(processor_kwargs)
+                log_message(f"Model reloaded in {time.perf_counter() - load_started_at:.2f}s.")
+
+            new_engine = None
+            if self.worker_count > 1:
+                new_engine = DocumentEngine(self.worker_count, self.processor_kwargs, metrics=self.metrics)
+                new_engine.preload()
+            with self.engine_lock:
+                old_engine, self.document_engine = self.document_engine, new_engine
+            if old_engine is not None:
+                # A document still running on the old workers finishes there first.
+                old_engine.shutdown(wait=True)
             self.root.after(0, self.on_processor_loaded)
         except Exception as e:
             self.root.after(0, lambda err=e: self.on_processor_load_error(err))
@@ -299,6 +397,8 @@ All portraits successfully created from the source images are collected. If one
     def on_processor_loaded(self):
         self.status_bar.config(text="Model loaded successfully. Ready.")
         log_message("Model initialized and ready.")
+        if self.document_engine:
+            log_message(f"Document engine ready with {self.document_engine.workers} worker processes.")
 
     def on_processor_load_error(self, error):
         self.status_bar.config(text="Error loading model!")
@@ -306,7 +406,7 @@ All portraits successfully created from the source images are collected. If one
         messagebox.showerror("Model Load Error", f"Could not initialize the AI model: {error}")
 
     def load_file(self):
-        if not self.image_processor:
+        if not self.processor_pool:
             messagebox.showwarning("Model Not Ready", "The AI model is still initializing. Please wait a moment.")
             return
 
@@ -324,56 +424,153 @@ All portraits successfully created from the source images are collected. If one
 
         self.reset_session()
         self.source_filepath = file_path
+        self.processing_started_at = time.perf_counter()
         self.status_bar.config(text=f"Loading file: {os.path.basename(file_path)}...")
         log_message(f"Loaded file: {file_path}")
         
         file_extension = os.path.splitext(file_path)[1].lower()
+        # Tk variables are read here, on the UI thread, and handed to the worker thread.
+        all_faces = self.all_faces_var.get()
+        use_prefilter = self.prefilter_var.get()
         
-        if file_extension in ['.jpg', '.jpeg', '.png', '.bmp']:
-            threading.Thread(target=self.process_image, args=(file_path,), daemon=True).start()
-        elif file_extension in ['.pdf', '.docx']:
+        if file_extension in IMAGE_EXTENSIONS:
+            token = self.start_processing()
+            threading.Thread(target=self.process_image, args=(file_path, all_faces, token), daemon=True).start()
+        elif file_extension in DOCUMENT_EXTENSIONS:
             log_message(f"Document file detected. Extracting images...")
-            threading.Thread(target=self.process_document, args=(file_path,), daemon=True).start()
+            token = self.start_processing()
+            threading.Thread(target=self.process_document, args=(file_path, all_faces, use_prefilter, token), daemon=True).start()
         else:
             unsupported_msg = f"Unsupported file type: '{file_extension}'. Please select a supported document or image file."
             log_message(f"Error: {unsupported_msg}")
             self.status_bar.config(text="Unsupported file type.")
             messagebox.showerror("Unsupported File", unsupported_msg)
     
-    def process_document(self, file_path):
+    def start_processing(self):
+        """Sets up the progress bar and Cancel button for a new run and returns its token."""
+        self.cancel_token = CancellationToken()
+        self.progress_bar.config(value=0)
+        self.cancel_button.config(state="normal")
+        return self.cancel_token
+
+    def finish_processing(self):
+        self.cancel_token = None
+        self.cancel_button.config(state="disabled")
+
+    def cancel_processing(self):
+        if self.cancel_token is None or self.cancel_token.cancelled:
+            return
+        self.cancel_token.cancel()
+        self.cancel_button.config(state="disabled")
+        self.status_bar.config(text="Cancelling...")
+        log_message("Cancelling the current file...")
+
+    def update_progress(self, token, fraction):
+        # Updates from a run that has been cancelled or replaced are ignored.
+        if token is self.cancel_token:
+            self.progress_bar.config(value=fraction)
+
+    @contextmanager
+    def engine_session(self):
+        """
+        Yields the document engine, or None without worker processes, and keeps a
+        reload from retiring that engine until the block ends.
+        """
+        with ExitStack() as stack:
+            with self.engine_lock:
+                engine = self.document_engine
+                if engine is not None:
+                    stack.enter_context(engine.session())
+            yield engine
+
+    def process_document(self, file_path, all_faces=False, use_prefilter=True, token=None):
         try:
-            images_from_doc = extract_images_from_document(file_path)
-            if not images_from_doc:
-                self.root.after(0, self.on_processing_complete)
-                return
+            from utils.document_handler import iter_images_from_document
+            from utils.image_prefilter import ImagePrefilter
 
-            log_message(f"Found {len(images_from_doc)} image(s) in the document. Searching for faces...")
+            # Images are pulled from the document one at a time while earlier ones are analyzed.
+            prefilter = ImagePrefilter() if use_prefilter else None
+            document_images = iter_images_from_document(file_path, prefilter=prefilter)
+            log_message("Searching the document's images for faces...")
             
+            # Skipped images keep their number, so track which image each result belongs to.
+            image_numbers = []
+            image_totals = []
+            def images():
+                for item in document_images:
+                    if len(item.locations) > 1:
+                        log_message(f"Image #{item.index+1} appears {len(item.locations)} times in the document; analyzing it once.")
+                    image_numbers.append(item.index + 1)
+                    image_totals.append(item.total)
+                    yield item.image
+
             valid_portraits = []
-            for i, pil_image in enumerate(images_from_doc):
-                log_message(f"Analyzing image #{i+1} from document...")
-                extracted_portrait = self.image_processor.extract_photo(pil_image)
-                if extracted_portrait:
-                    valid_portraits.append(extracted_portrait)
+            def collect(results):
+                for i, result in enumerate(results):
+                    log_message(f"Finished image #{image_numbers[i]} from document.")
+                    if image_totals[i]:
+                        self.root.after(0, self.update_progress, token, image_numbers[i] / image_totals[i])
+                    if all_faces:
+                        valid_portraits.extend(result)
+                    elif result:
+                        valid_portraits.append(result)
+
+            with self.engine_session() as engine:
+                if engine is not None:
+                    log_message(f"Analyzing images across {engine.workers} worker processes...")
+                    collect(engine.iter_extract_photos(images(), all_faces=all_faces, cancel_token=token))
+                else:
+                    from processing.pipeline import DocumentPipeline
+
+                    # The next image is extracted and searched for photo shapes while the
+                    # model works on the current one.
+                    with self.processor_pool.checkout() as processor:
+                        collect(DocumentPipeline(processor).iter_extract_photos(
+                            images(), all_faces=all_faces, cancel_token=token
+                        ))
             
-            self.extracted_portraits = valid_portraits
-            self.root.after(0, self.on_processing_complete)
+            self.root.after(0, self.on_processing_complete, token, valid_portraits)
 
+        except OperationCancelled:
+            self.root.after(0, self.on_processing_cancelled, token)
         except Exception as e:
-            self.root.after(0, lambda err=e: self.on_processing_error(err))
+            self.root.after(0, lambda err=e: self.on_processing_error(err, token))
+
+    def process_image(self, file_path_or_pil, all_faces=False, token=None):
+        def progress(done, total):
+            self.root.after(0, self.update_progress, token, done / total)
 
-    def process_image(self, file_path_or_pil):
         try:
-            extracted_portrait = self.image_processor.extract_photo(file_path_or_pil)
-            if extracted_portrait:
-                self.extracted_portraits = [extracted_portrait]
-            else:
-                self.extracted_portraits = []
-            self.root.after(0, self.on_processing_complete)
+            with self.processor_pool.checkout() as processor:
+                if all_faces:
+                    portraits = processor.extract_all_photos(file_path_or_pil, progress, token)
+                else:
+                    extracted_portrait = processor.extract_photo(file_path_or_pil, progress, token)
+                    portraits = [extracted_portrait] if extracted_portrait else []
+            self.root.after(0, self.on_processing_complete, token, portraits)
+        except OperationCancelled:
+            self.root.after(0, self.on_processing_cancelled, token)
         except Exception as e:
-            self.root.after(0, lambda err=e: self.on_processing_error(err))
+            self.root.after(0, lambda err=e: self.on_processing_error(err, token))
             
-    def on_processing_complete(self):
+    def report_processing_time(self):
+        if self.processing_started_at is None:
+            return
+        elapsed = time.perf_counter() - self.processing_started_at
+        if not self.first_result_reported:
+            self.first_result_reported = True
+            log_message(f"First file processed in {elapsed:.2f}s.")
+        else:
+            log_message(f"File processed in {elapsed:.2f}s.")
+        self.processing_started_at = None
+
+    def on_processing_complete(self, token, portraits):
+        if token is not self.cancel_token:
+            return
+        self.finish_processing()
+        self.progress_bar.config(value=1.0)
+        self.report_processing_time()
+        self.extracted_portraits = portraits
         num_found = len(self.extracted_portraits)
         
         if num_found == 0:
@@ -382,6 +579,7 @@ All portraits successfully created from the source images are collected. If one
             messagebox.showinfo("Processing Complete", "Could not find a usable photo in the selected file.")
         else:
             self.file_menu.entryconfig("Save Extracted Photos...", state="normal")
+            self.file_menu.entryconfig("Save All to Folder...", state="normal")
             
             plural_s = "s" if num_found > 1 else ""
             self.status_bar.config(text=f"Successfully extracted {num_found} photo{plural_s}.")
@@ -390,15 +588,32 @@ All portraits successfully created from the source images are collected. If one
             if num_found == 1:
                 prompt = "A photo was successfully extracted.\n\nDo you want to save it?"
             else:
-                prompt = f"{num_found} photos were successfully extracted.\n\nYou will be prompted to save each one individually.\n\nDo you want to proceed with saving?"
+                prompt = f"{num_found} photos were successfully extracted.\n\nDo you want to save them all to a folder?"
 
             if messagebox.askyesno("Extraction Successful", prompt):
-                self.save_images()
+                if num_found == 1:
+                    self.save_images()
+                else:
+                    self.save_all_to_folder()
             else:
                 self.status_bar.config(text="Extraction complete. User chose not to save.")
                 log_message("User chose not to save the extracted photo(s).")
 
-    def on_processing_error(self, error):
+    def on_processing_cancelled(self, token):
+        if token is not self.cancel_token:
+            # Cancelled by a reset or by loading another file; nothing left to report.
+            return
+        self.finish_processing()
+        self.processing_started_at = None
+        self.progress_bar.config(value=0)
+        self.status_bar.config(text="Processing cancelled.")
+        log_message("Processing cancelled.")
+
+    def on_processing_error(self, error, token=None):
+        if token is not self.cancel_token:
+            return
+        self.finish_processing()
+        self.report_processing_time()
         self.status_bar.config(text="An error occurred during processing.")
         log_message(f"Error: {error}")
         messagebox.showerror("Processing Error", f"An error occurred: {error}")
@@ -417,12 +632,7 @@ All portraits successfully created from the source images are collected. If one
         num_to_save = len(self.extracted_portraits)
 
         for i, portrait_to_save in enumerate(self.extracted_portraits):
-            if num_to_save > 1:
-                suffix = f"_img_extracted{i + 1}"
-            else:
-                suffix = "_img_extracted"
-            
-            default_filename = f"{base_name}{suffix}.jpg"
+            default_filename = build_portrait_filename(base_name, i, num_to_save)
             
             save_path = filedialog.asksaveasfilename(
                 parent=self.root,
@@ -447,7 +657,86 @@ All portraits successfully created from the source images are collected. If one
                     if messagebox.askyesno("Cancel Saving", "Do you want to cancel saving the rest of the photos?"):
                         log_message("User aborted saving remaining photos.")
                         break
-                
+
+    def save_all_to_folder(self):
+        if not self.extracted_portraits or not self.source_filepath:
+            log_message("Save command issued, but no images are extracted.")
+            return
+        if self.export_running:
+            log_message("An export is already running.")
+            return
+
+        base_name = os.path.basename(os.path.splitext(self.source_filepath)[0])
+        as_zip = self.export_zip_var.get()
+        if as_zip:
+            destination = filedialog.asksaveasfilename(
+                parent=self.root,
+                title="Save All Photos to a ZIP Archive",
+                initialfile=f"{base_name}_img_extracted.zip",
+                defaultextension=".zip",
+                filetypes=[("ZIP archives", "*.zip")]
+            )
+        else:
+            destination = filedialog.askdirectory(parent=self.root, title="Save All Photos to Folder")
+        if not destination:
+            log_message("User cancelled save operation.")
+            return
+
+        options = {
+            "fmt": self.export_format_var.get(),
+            "quality": self.export_quality,
+            "thumbnail_size": self.export_size_var.get() or None,
+            "as_zip": as_zip,
+        }
+        self.export_running = True
+        self.file_menu.entryconfig("Save All to Folder...", state="disabled")
+        self.status_bar.config(text=f"Exporting {len(self.extracted_portraits)} photos...")
+        threading.Thread(
+            target=self.export_portraits,
+            args=(list(self.extracted_portraits), base_name, destination, options),
+            daemon=True
+        ).start()
+
+    def export_portraits(self, portraits, base_name, destination, options):
+        from utils.portrait_export import export_portraits
+
+        def progress(done, total):
+            self.root.after(0, lambda: self.status_bar.config(text=f"Exporting photos... {done}/{total}"))
+
+        try:
+            started_at = time.perf_counter()
+            written = export_portraits(portraits, base_name, destination, progress=progress, **options)
+            elapsed = time.perf_counter() - started_at
+            self.root.after(0, self.on_export_complete, len(portraits), destination, len(written), elapsed)
+        except Exception as e:
+            self.root.after(0, self.on_export_error, e)
+
+    def on_export_complete(self, count, destination, files, elapsed):
+        self.export_running = False
+        if self.extracted_portraits:
+            self.file_menu.entryconfig("Save All to Folder...", state="normal")
+        plural_s = "s" if count > 1 else ""
+        self.status_bar.config(text=f"{count} photo{plural_s} saved to {os.path.basename(destination)}")
+        log_message(f"{count} extracted photo{plural_s} saved to: {destination} ({files} file(s), {elapsed:.2f}s)")
+
+    def on_export_error(self, error):
+        self.export_running = False
+        if self.extracted_portraits:
+            self.file_menu.entryconfig("Save All to Folder...", state="normal")
+        self.status_bar.config(text="Error saving images.")
+        log_message(f"Error exporting photos: {error}", "error")
+        messagebox.showerror("Save Error", f"Could not save the images: {error}")
+
+    def set_export_quality(self):
+        quality = simpledialog.askinteger(
+            "Export Quality",
+            "JPEG and WebP quality used by Save All to Folder (1-100):",
+            parent=self.root, initialvalue=self.export_quality, minvalue=1, maxvalue=100
+        )
+        if quality:
+            self.export_quality = quality
+            log_message(f"Export quality set to {quality}.")
+
     def copy_logs(self):
         self.root.clipboard_clear()
         self.root.clipboard_append(self.log_text.get("1.0", tk.END))
@@ -459,12 +748,18 @@ All portraits successfully created from the source images are collected. If one
         self.log_text.config(state=tk.DISABLED)
 
     def reset_session(self):
+        if self.cancel_token is not None:
+            # The previous run stops at its next check instead of finishing in the background.
+            self.cancel_token.cancel()
+            self.finish_processing()
+        self.progress_bar.config(value=0)
         self.clear_logs()
         self.status_bar.config(text="Ready")
         self.source_filepath = None
         self.extracted_portraits = []
         if hasattr(self, 'file_menu'):
              self.file_menu.entryconfig("Save Extracted Photos...", state="disabled")
+             self.file_menu.entryconfig("Save All to Folder...", state="disabled")
         log_message("Session has been reset.")
         
     def show_about(self):
@@ -493,13 +788,68 @@ All portraits successfully created from the source images are collected. If one
 
     def force_reload_model(self):
         if messagebox.askyesno("Reload Model", "This will reload the AI model, which may take a moment. Are you sure?"):
-            self.load_button.config(state="disabled")
-            self.reset_button.config(state="disabled")
-            self.image_processor = None
             self.initialize_processor()
-            self.load_button.config(state="normal")
-            self.reset_button.config(state="normal")
     
+    def change_backend(self):
+        self.processor_kwargs["backend"] = self.backend_var.get()
+        self.processor_kwargs["int8"] = self.int8_var.get()
+        log_message(f"Switching inference backend to '{self.backend_var.get()}'"
+                    f"{' (INT8)' if self.int8_var.get() else ''}. The first load converts the model and may take a while...")
+        self.initialize_processor()
+
+    def toggle_result_cache(self):
+        if self.cache_results_var.get():
+            cache_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "data", "cache"))
+            self.processor_kwargs["cache_dir"] = cache_dir
+            log_message(f"Caching results in '{cache_dir}', so re-opened files are answered without "
+                        "running the model. Reloading the model...")
+        else:
+            self.processor_kwargs.pop("cache_dir", None)
+            log_message("Result caching disabled. Reloading the model...")
+        self.initialize_processor()
+
+    def set_worker_count(self):
+        count = simpledialog.askinteger(
+            "Worker Processes",
+            "Number of worker processes used to analyze document images\n"
+            "(1 = process in the background thread only; each extra process loads its own model):",
+            parent=self.root, initialvalue=self.worker_count, minvalue=1, maxvalue=64
+        )
+        if not count or count == self.worker_count:
+            return
+
+        self.worker_count = count
+        log_message(f"Worker process count set to {count}. Reloading the model...")
+        self.initialize_processor()
+
+    def export_metrics(self):
+        if not self.metrics.calls:
+            messagebox.showinfo("Export Metrics", "No images have been processed in this session yet.")
+            return
+
+        save_path = filedialog.asksaveasfilename(
+            parent=self.root,
+            title="Export Metrics",
+            initialfile="image_extractor_metrics.prom",
+            defaultextension=".prom",
+            filetypes=[("Prometheus text", "*.prom"), ("JSON lines", "*.jsonl")]
+        )
+        if not save_path:
+            return
+
+        fmt = "jsonl" if save_path.lower().endswith(".jsonl") else "prometheus"
+        try:
+            self.metrics.write(save_path, fmt)
+            log_message(f"Metrics for {self.metrics.calls} extraction(s) exported to: {save_path}")
+        except OSError as e:
+            log_message(f"Error exporting metrics: {e}", "error")
+            messagebox.showerror("Export Error", f"Could not export the metrics: {e}")
+
+    def shutdown_engine(self):
+        if self.document_engine:
+            self.document_engine.shutdown()
+            self.document_engine = None
+
     def open_model_folder(self):
         try:
             model_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "data", "models"))
@@ -530,4 +880,5 @@ All portraits successfully created from the source images are collected. If one
 if __name__ == "__main__":
     root = tk.Tk()
     app = ImageExtractorApp(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    app.shutdown_engine()
\ No newline at end of file
@@ -0,0 +1,212 @@
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from processing import worker_process
+from processing.processor_pool import threads_per_instance
+from processing.pipeline import DocumentPipeline
+from utils.document_handler import iter_images_from_document
+from utils.file_types import IMAGE_EXTENSIONS, SUPPORTED_EXTENSIONS
+from utils.file_naming import build_portrait_filename
+from utils.logging_config import setup_console_logging, log_message
+
+def _init_worker(processor_kwargs, threads_per_worker):
+    setup_console_logging()
+    worker_process.init_worker(processor_kwargs, threads_per_worker)
+
+def find_input_files(input_dir):
+    """
+    Recursively collects every supported image or document below a directory.
+
+    Args:
+        input_dir (str): The directory to scan.
+
+    Returns:
+        list: Sorted file paths with a supported extension.
+    """
+    found = []
+    for dir_path, _, file_names in os.walk(input_dir):
+        for file_name in file_names:
+            if os.path.splitext(file_name)[1].lower() in SUPPORTED_EXTENSIONS:
+                found.append(os.path.join(dir_path, file_name))
+    return sorted(found)
+
+def output_base_names(files):
+    """
+    Returns the base name the portraits of each file are saved under: the file name
+    without its extension, or, when several files of one directory share that name
+    (e.g. a.jpg, a.png and a.pdf), the name with the extension appended (a_jpg,
+    a_png, a_pdf), so that no file overwrites the portraits of another. Names are
+    compared case-insensitively, as on Windows and macOS file systems.
+
+    Args:
+        files (list): The input file paths.
+
+    Returns:
+        dict: File path -> base name.
+    """
+    stems = {}
+    for file_path in files:
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        key = (os.path.dirname(file_path), stem.lower())
+        stems[key] = stems.get(key, 0) + 1
+
+    base_names, used = {}, set()
+    for file_path in files:
+        directory = os.path.dirname(file_path)
+        stem, extension = os.path.splitext(os.path.basename(file_path))
+        if stems[(directory, stem.lower())] > 1:
+            stem = f"{stem}_{extension.lstrip('.').lower()}"
+        # A counter settles the rare remaining clash, e.g. with an input named a_png.jpg.
+        base_name, counter = stem, 2
+        while (directory, base_name.lower()) in used:
+            base_name, counter = f"{stem}_{counter}", counter + 1
+        used.add((directory, base_name.lower()))
+        base_names[file_path] = base_name
+    return base_names
+
+def _as_portrait_list(result):
+    """Normalizes an extract_photo (portrait or None) or extract_all_photos (list) result."""
+    if isinstance(result, list):
+        return result
+    return [result] if result else []
+
+def extract_portraits_from_file(processor, file_path, document_kwargs=None, all_faces=False,
+                                encode=None, pipeline_kwargs=None):
+    """
+    Runs the full extraction pipeline on a single image or document file. The
+    images of a document go through a DocumentPipeline, so that extracting,
+    shape finding, inference, cropping and encoding of consecutive images overlap.
+
+    Args:
+        processor (ImageProcessor): A loaded processor.
+        file_path (str): The image or document to process.
+        document_kwargs (dict): Extra keyword arguments for iter_images_from_document.
+        all_faces (bool): Extract every portrait of each image, not just one.
+        encode (callable): Optional function applied to each portrait, e.g. to
+                           produce JPEG bytes in a pipeline stage of its own.
+        pipeline_kwargs (dict): Extra keyword arguments for DocumentPipeline.
+
+    Returns:
+        list: The extracted portraits as PIL Image objects (or as returned by
+              `encode`), in document order.
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+
+    if file_extension in IMAGE_EXTENSIONS:
+        if all_faces:
+            portraits = processor.extract_all_photos(file_path)
+        else:
+            portraits = _as_portrait_list(processor.extract_photo(file_path))
+        return [encode(portrait) for portrait in portraits] if encode else portraits
+
+    def encode_result(result):
+        return [encode(portrait) for portrait in _as_portrait_list(result)]
+
+    pipeline = DocumentPipeline(processor, **(pipeline_kwargs or {}))
+    document_images = (item.image for item in iter_images_from_document(file_path, **(document_kwargs or {})))
+    results = pipeline.iter_extract_photos(document_images, all_faces, encode_result if encode else None)
+
+    portraits = []
+    for result in results:
+        portraits.extend(result if encode else _as_portrait_list(result))
+    return portraits
+
+def _encode_jpeg(portrait, jpeg_quality):
+    buffer = io.BytesIO()
+    portrait.save(buffer, "JPEG", quality=jpeg_quality)
+    return buffer.getvalue()
+
+def _process_file(file_path, base_name, input_dir, output_dir, jpeg_quality, document_kwargs, all_faces,
+                  pipeline_kwargs):
+    """
+    Worker task: extracts the portraits of one file and writes them to the
+    output directory under `base_name`, mirroring the input sub-directories.
+    Returns (file_path, saved_paths, error_message, metrics_records).
+    """
+    worker_process.start_task()
+    try:
+        encoded_portraits = extract_portraits_from_file(
+            worker_process.processor, file_path, document_kwargs, all_faces,
+            encode=lambda portrait: _encode_jpeg(portrait, jpeg_quality), pipeline_kwargs=pipeline_kwargs
+        )
+
+        relative_dir = os.path.relpath(os.path.dirname(file_path), input_dir)
+        target_dir = os.path.normpath(os.path.join(output_dir, relative_dir))
+        os.makedirs(target_dir, exist_ok=True)
+
+        saved_paths = []
+        for i, jpeg_bytes in enumerate(encoded_portraits):
+            save_path = os.path.join(target_dir, build_portrait_filename(base_name, i, len(encoded_portraits)))
+            with open(save_path, "wb") as f:
+                f.write(jpeg_bytes)
+            saved_paths.append(save_path)
+
+        return file_path, saved_paths, None, list(worker_process.records)
+    except Exception as e:
+        return file_path, [], str(e), list(worker_process.records)
+
+def run_batch(input_dir, output_dir, workers=None, jpeg_quality=95, processor_kwargs=None,
+              document_kwargs=None, metrics=None, all_faces=False, pipeline_kwargs=None, threads_per_worker=None):
+    """
+    Extracts portraits from every supported file below `input_dir` without any
+    user interaction, spreading the files across a pool of worker processes.
+
+    Args:
+        input_dir (str): Directory containing images, PDFs and DOCX files.
+        output_dir (str): Directory the portraits are written to.
+        workers (int): Number of worker processes. Defaults to the CPU count.
+        jpeg_quality (int): JPEG quality used for the saved portraits.
+        processor_kwargs (dict): Extra keyword arguments for ImageProcessor.
+        document_kwargs (dict): Extra keyword arguments for iter_images_from_document.
+        metrics (MetricsRegistry): Receives the per-stage metrics of every
+                                   extract_photo call made by the workers.
+        all_faces (bool): Extract every portrait of each image, not just one.
+        pipeline_kwargs (dict): Stage worker counts and queue size for the
+                                DocumentPipeline each worker runs documents through.
+        threads_per_worker (int): Intra-op threads of each worker's model. Defaults
+                                  to an even share of the CPU cores.
+
+    Returns:
+        dict: Counts of processed files, failed files and saved portraits.
+    """
+    files = find_input_files(input_dir)
+    summary = {"files": len(files), "failed": 0, "portraits": 0}
+    if not files:
+        log_message(f"No supported files found in '{input_dir}'.", "warning")
+        return summary
+
+    base_names = output_base_names(files)
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(files))
+    threads_per_worker = threads_per_worker or threads_per_instance(workers)
+    os.makedirs(output_dir, exist_ok=True)
+    log_message(f"Processing {len(files)} file(s) with {workers} worker process(es), "
+                f"{threads_per_worker} thread(s) each...")
+    started_at = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(processor_kwargs or {}, threads_per_worker)) as executor:
+        futures = [
+            executor.submit(_process_file, file_path, base_names[file_path], input_dir, output_dir, jpeg_quality,
+                            document_kwargs, all_faces, pipeline_kwargs)
+            for file_path in files
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            file_path, saved_paths, error, records = future.result()
+            if metrics is not None:
+                for record in records:
+                    metrics.observe(record)
+            if done == 1:
+                log_message(f"First file finished {time.perf_counter() - started_at:.2f}s after start "
+                            f"(includes worker start-up and model warm-up).")
+            if error:
+                summary["failed"] += 1
+                log_message(f"[{done}/{len(files)}] Error processing '{file_path}': {error}", "error")
+            else:
+                summary["portraits"] += len(saved_paths)
+                log_message(f"[{done}/{len(files)}] {os.path.basename(file_path)}: {len(saved_paths)} portrait(s) saved.")
+
+    log_message(f"Processed {len(files)} file(s) in {time.perf_counter() - started_at:.2f}s.")
+
+    return summary
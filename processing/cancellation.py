@@ -0,0 +1,29 @@
+import threading
+
+class OperationCancelled(Exception):
+    """Raised by a processing call whose CancellationToken has been cancelled."""
+
+class CancellationToken:
+    """
+    A flag shared between the code running an extraction and the code that may
+    abandon it. The processing code calls raise_if_cancelled() between pages,
+    photo candidates and model calls, so a cancelled run stops at the next of
+    those points instead of finishing the document.
+
+    Args:
+        event: The underlying event, e.g. a multiprocessing.Event to reach worker
+               processes. A new threading.Event by default.
+    """
+    def __init__(self, event=None):
+        self._event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled("The operation was cancelled.")
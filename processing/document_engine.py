@@ -0,0 +1,176 @@
+import itertools
+import multiprocessing
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, wait
+from processing.cancellation import CancellationToken
+from processing.metrics import MetricsRegistry
+from processing.processor_pool import threads_per_instance
+from processing import worker_process
+
+# Shared with the parent: the ids of the runs (iter_extract_photos calls) it has abandoned.
+_worker_cancelled_runs = None
+
+class _RunCancelEvent:
+    """The event behind the CancellationToken of one run: set once that run is cancelled."""
+    def __init__(self, cancelled_runs, run_id):
+        self._cancelled_runs = cancelled_runs
+        self._run_id = run_id
+
+    def set(self):
+        self._cancelled_runs[self._run_id] = True
+
+    def is_set(self):
+        return self._run_id in self._cancelled_runs
+
+def _init_worker(processor_kwargs, threads_per_worker, cancelled_runs):
+    global _worker_cancelled_runs
+    _worker_cancelled_runs = cancelled_runs
+    worker_process.init_worker(processor_kwargs, threads_per_worker)
+
+def _worker_ready():
+    return os.getpid()
+
+def _extract_in_worker(pil_image, run_id, all_faces=False):
+    worker_process.start_task()
+    cancel_token = CancellationToken(_RunCancelEvent(_worker_cancelled_runs, run_id))
+    if all_faces:
+        result = worker_process.processor.extract_all_photos(pil_image, cancel_token=cancel_token)
+    else:
+        result = worker_process.processor.extract_photo(pil_image, cancel_token=cancel_token)
+    return result, list(worker_process.records)
+
+class DocumentEngine:
+    """
+    Fans the images of a document out across a pool of worker processes, each
+    holding its own preloaded ImageProcessor, and returns the results in
+    document order.
+
+    Per-stage metrics recorded in the workers are aggregated into `metrics`
+    (a MetricsRegistry) in the parent process.
+
+    Callers hold a session() around their use of the engine, so that
+    shutdown(wait=True) can retire an engine, e.g. one replaced by a newly loaded
+    one, without stopping the documents still running on it.
+    """
+    def __init__(self, workers=None, processor_kwargs=None, metrics=None):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        threads_per_worker = threads_per_instance(self.workers)
+        # Each run gets its own id, so stopping an abandoned document does not stop
+        # another one running at the same time on the same workers.
+        self._run_ids = itertools.count()
+        self._manager = multiprocessing.Manager()
+        self._cancelled_runs = self._manager.dict()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(processor_kwargs or {}, threads_per_worker, self._cancelled_runs)
+        )
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._condition = threading.Condition()
+        # Number of open sessions.
+        self._active = 0
+        self._closed = False
+
+    @contextmanager
+    def session(self):
+        """Holds the engine open for the block; shutdown(wait=True) waits for it."""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The document engine has been shut down.")
+            self._active += 1
+        try:
+            yield self
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+
+    def preload(self):
+        """
+        Starts every worker process and waits until each has loaded its model,
+        so the first document does not pay the model load time.
+        """
+        futures = [self._executor.submit(_worker_ready) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def _collect(self, future, cancel_token=None):
+        if cancel_token is not None:
+            while not future.done() and not cancel_token.cancelled:
+                wait([future], timeout=0.1)
+            cancel_token.raise_if_cancelled()
+        result, records = future.result()
+        for record in records:
+            self.metrics.observe(record)
+        return result
+
+    def _collect_next(self, pending, cancel_token):
+        # The future stays in `pending` until its result is in, so a cancellation can still stop it.
+        result = self._collect(pending[0], cancel_token)
+        pending.popleft()
+        return result
+
+    def _stop_pending(self, pending, run_id):
+        """Cancels the queued images of a run and stops its running ones at their next check."""
+        _RunCancelEvent(self._cancelled_runs, run_id).set()
+        try:
+            for future in pending:
+                future.cancel()
+            wait(pending)
+        finally:
+            self._cancelled_runs.pop(run_id, None)
+
+    def iter_extract_photos(self, images, max_in_flight=None, all_faces=False, cancel_token=None):
+        """
+        Runs ImageProcessor.extract_photo on every image in parallel.
+
+        The input is consumed lazily: at most `max_in_flight` images (twice the
+        worker count by default) are submitted at any time, so a streaming
+        source is never read far ahead of the workers.
+
+        Args:
+            images (iterable): PIL Image objects, in document order.
+            max_in_flight (int): Upper bound on submitted, unfinished images.
+            all_faces (bool): Use extract_all_photos instead of extract_photo.
+            cancel_token (CancellationToken): Once cancelled, no further image is
+                                              submitted, the images in the workers are
+                                              stopped and OperationCancelled is raised.
+
+        Yields:
+            The extracted portrait (or None) for each image, in the same order
+            as the input. With `all_faces`, the list of portraits of each image.
+        """
+        max_in_flight = max_in_flight or 2 * self.workers
+        run_id = next(self._run_ids)
+        pending = deque()
+
+        try:
+            for pil_image in images:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                pending.append(self._executor.submit(_extract_in_worker, pil_image, run_id, all_faces))
+                if len(pending) >= max_in_flight:
+                    yield self._collect_next(pending, cancel_token)
+
+            while pending:
+                yield self._collect_next(pending, cancel_token)
+        finally:
+            # Reached with images still pending when cancelled, or when the caller stops early.
+            if pending:
+                self._stop_pending(pending, run_id)
+
+    def shutdown(self, wait=False):
+        """
+        Refuses new sessions and stops the worker processes. With `wait`, the open
+        sessions are finished first; otherwise their queued images are cancelled.
+        """
+        with self._condition:
+            self._closed = True
+            if wait:
+                while self._active:
+                    self._condition.wait()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._manager.shutdown()
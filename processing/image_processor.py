@@ -1,11 +1,68 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
 from PIL import Image
 import os
+import time
+from processing.result_cache import ResultCache, hash_file, hash_pil_image
+from processing.inference_backends import create_backend, DEFAULT_CONFIDENCE, DEFAULT_IMAGE_SIZE
+from processing.metrics import CallMetrics
+
+class PhotoJob:
+    """
+    The state of one extract_photo call as it moves through the stages
+    begin_extraction -> detect_faces -> finish_extraction. The stages can run on
+    different threads, e.g. in processing.pipeline.DocumentPipeline.
+
+    `done` is set as soon as the result is known (a cache hit, or no face found);
+    the remaining stages then pass the job through unchanged. `cancel_token` is
+    checked by every stage and before every model call.
+    """
+    def __init__(self, source, cancel_token=None):
+        self.source = source
+        self.cancel_token = cancel_token
+        self.metrics = CallMetrics()
+        self.started_at = time.perf_counter()
+        self.cache_key = None
+        self.done = False
+        self.portrait = None
+        self.image_rgb = None
+        self.source_image_pil = None
+        self.view_scale = 1.0
+        self.candidates = None
+        self.crop_source = None
+        self.face_box = None
+        self.approx = None
+
+    def release_buffers(self):
+        self.image_rgb = self.source_image_pil = self.candidates = self.crop_source = None
 
 class ImageProcessor:
-    def __init__(self, model_filename="model.pt"):
+    # Proportions of the final square portrait, relative to the detected face.
+    HEADROOM_RATIO = 0.35
+    SHOULDER_ROOM_RATIO = 0.7
+    HORIZONTAL_PADDING_RATIO = 0.4
+
+    # The blur and closing sizes of the contour search are tuned for an image whose
+    # longest side is at most this many pixels, and scaled for other resolutions.
+    MORPHOLOGY_REFERENCE_SIDE = 1600
+
+    # Rough peak memory of the detection stages per pixel of the decoded image: the
+    # RGB buffer, the grayscale working buffer, candidate crops and warped photos.
+    WORKING_BYTES_PER_PIXEL = 10
+
+    # EXIF orientation tag values and the transposition that makes the image upright.
+    EXIF_TRANSPOSE = {
+        2: Image.Transpose.FLIP_LEFT_RIGHT, 3: Image.Transpose.ROTATE_180, 4: Image.Transpose.FLIP_TOP_BOTTOM,
+        5: Image.Transpose.TRANSPOSE, 6: Image.Transpose.ROTATE_270, 7: Image.Transpose.TRANSVERSE,
+        8: Image.Transpose.ROTATE_90,
+    }
+
+    def __init__(self, model_filename="model.pt", validation_batch_size=8,
+                 reuse_validation_detections=True, reuse_min_confidence=0.6,
+                 detection_max_side=1600, cache_dir=None, cache_max_bytes=512 * 1024 * 1024,
+                 backend="torch", int8=False, calibration_data=None, metrics_hooks=None,
+                 multi_face_iou=0.4, draft_max_side=None, memory_budget_mb=None, intra_op_threads=None,
+                 validation_image_size=None, validation_confidence=None, crop_image_size=None, crop_confidence=None):
         # Construct the model path relative to the script's directory
         current_dir = os.path.dirname(os.path.abspath(__file__))
         model_path = os.path.join(current_dir, "..", "data", "models", model_filename)
@@ -16,30 +73,167 @@ class ImageProcessor:
                 f"Please ensure 'model.pt' is in the 'data/models' directory relative to the script."
             )
         
-        self.model = YOLO(model_path)
-        self.model.conf = 0.4 # Confidence threshold
+        # "torch" runs the .pt weights through ultralytics; "onnx" and "openvino" run a
+        # converted copy cached next to them (see processing/inference_backends.py).
+        # `intra_op_threads` caps the threads of one model call (onnx and openvino; see
+        # processing/processor_pool.py for torch).
+        self.backend = create_backend(model_path, backend, int8, calibration_data, intra_op_threads)
+
+        # Model input size and confidence threshold of the two kinds of model call. The
+        # validation of photo candidates only needs to know whether a face is there and
+        # runs once per candidate, so a smaller input (e.g. 320) saves most of the model
+        # time; the crop pass, which places the portrait frame, keeps the full size.
+        self.validation_image_size = validation_image_size or DEFAULT_IMAGE_SIZE
+        self.validation_confidence = DEFAULT_CONFIDENCE if validation_confidence is None else validation_confidence
+        self.crop_image_size = crop_image_size or DEFAULT_IMAGE_SIZE
+        self.crop_confidence = DEFAULT_CONFIDENCE if crop_confidence is None else crop_confidence
+
+        # Number of photo candidates validated per model call. 1 reproduces the
+        # one-inference-per-candidate behaviour; larger values batch them.
+        self.validation_batch_size = max(1, int(validation_batch_size))
+
+        # When enabled, the face found while validating a photo shape is projected
+        # into the straightened photo and reused for the final crop, instead of
+        # running the model a second time. Low-confidence hits are still re-detected,
+        # and so is every hit of a validation pass run at a smaller input size than
+        # the crop pass, as its boxes are too coarse to place the portrait frame.
+        self.reuse_validation_detections = reuse_validation_detections
+        self.reuse_min_confidence = reuse_min_confidence
+
+        # The contour search runs on a copy whose longest side is at most this many
+        # pixels; the corners are then refined at full resolution. None disables it.
+        self.detection_max_side = detection_max_side
 
-    def _find_photo_shape_on_document(self, image_cv):
+        # Optional on-disk cache of results, keyed by the input content, the model
+        # weights and every setting that can change the extracted portrait.
+        self.result_cache = None
+        if cache_dir:
+            try:
+                self.result_cache = ResultCache(cache_dir, cache_max_bytes)
+            except OSError as e:
+                # e.g. a read-only install directory; processing works the same without the cache.
+                print(f"WARNING: Could not open the result cache at '{cache_dir}' ({e}); caching is disabled.")
+        if self.result_cache is not None:
+            self._cache_context = ResultCache.make_key(
+                hash_file(model_path), self.backend.name, int8, self.HEADROOM_RATIO, self.SHOULDER_ROOM_RATIO,
+                self.HORIZONTAL_PADDING_RATIO, self.reuse_validation_detections,
+                self.reuse_min_confidence, self.detection_max_side, draft_max_side, memory_budget_mb,
+                self.validation_image_size, self.validation_confidence, self.crop_image_size, self.crop_confidence
+            )
+
+        # JPEG files larger than this are decoded at a reduced scale for detection, and
+        # only the final crop is taken from the full-resolution file. None disables it.
+        self.draft_max_side = draft_max_side
+
+        # Upper bound on the memory one extraction may use. Larger inputs are processed
+        # on a downsampled view and only the final crop is taken at full resolution.
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024) if memory_budget_mb else None
+
+        # Overlap above which two faces found by extract_all_photos count as the same one.
+        self.multi_face_iou = multi_face_iou
+
+        # Callables receiving a CallMetrics.as_record() dict after every extract_photo call.
+        self.metrics_hooks = list(metrics_hooks or [])
+
+    def add_metrics_hook(self, hook):
         """
-        Finds the physical photo on the document and returns a de-skewed PIL image.
+        Registers a callable that receives the per-stage timings and counts of every
+        extract_photo call, e.g. MetricsRegistry.observe.
         """
-        gray = cv2.cvtColor(image_cv, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0) 
-        
-        thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                       cv2.THRESH_BINARY_INV, 11, 2)
+        self.metrics_hooks.append(hook)
+
+    @property
+    def validation_boxes_precise(self):
+        """Whether validation boxes are as precise as those of the crop pass."""
+        return self.validation_image_size >= self.crop_image_size
+
+    def _predict(self, images, metrics, cancel_token=None, validation=False):
+        """
+        Runs the backend on a batch of images and records the call. `validation`
+        selects the input size and threshold of the validation pass instead of
+        those of the crop pass.
+        """
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        if validation:
+            image_size, confidence = self.validation_image_size, self.validation_confidence
+        else:
+            image_size, confidence = self.crop_image_size, self.crop_confidence
+        started_at = time.perf_counter()
+        detections = self.backend.predict(images, confidence, image_size)
+        metrics.record_model_call(time.perf_counter() - started_at, len(images))
+        return detections
+
+    def warm_up(self):
+        """
+        Runs one inference on a blank image at each input size in use, so that the
+        first real image does not pay for the lazy allocations of the model stack.
+        Returns the time taken in seconds.
+        """
+        started_at = time.perf_counter()
+        for image_size in sorted({self.validation_image_size, self.crop_image_size}):
+            self.backend.predict([Image.new("RGB", (image_size, image_size))], self.crop_confidence, image_size)
+        return time.perf_counter() - started_at
+
+    def _find_candidate_quads(self, image_rgb, metrics=None):
+        """
+        Runs the contour search and returns every 4-corner shape that passes the
+        area and aspect-ratio filters, largest first, as (approx, bounding_rect) pairs.
+
+        Large images are searched on a downscaled copy, and the corners of each
+        surviving quad are mapped back and refined on the full-resolution image. The
+        area and aspect-ratio filters are scale-invariant. The blur and closing
+        kernel sizes are scaled with the searched copy, relative to the image at
+        MORPHOLOGY_REFERENCE_SIDE (or its own size, if smaller), so the shapes found
+        are about the same for every `detection_max_side`. The threshold block stays
+        11 pixels: applied after the scaled blur, it already follows the resolution.
+        With the default of 1600, and for images of at most 1600 pixels, the sizes
+        are the original 5 and 7 pixels.
+        """
+        metrics = metrics or CallMetrics()
+        threshold_started_at = time.perf_counter()
+
+        img_h, img_w = image_rgb.shape[:2]
+        scale = 1.0
+        if self.detection_max_side and max(img_w, img_h) > self.detection_max_side:
+            scale = self.detection_max_side / float(max(img_w, img_h))
+            search_rgb = cv2.resize(image_rgb, (max(1, round(img_w * scale)), max(1, round(img_h * scale))),
+                                   interpolation=cv2.INTER_AREA)
+        else:
+            search_rgb = image_rgb
+
+        search_h, search_w = search_rgb.shape[:2]
+        reference_side = min(max(img_w, img_h), self.MORPHOLOGY_REFERENCE_SIDE)
+        size_factor = max(search_w, search_h) / float(reference_side)
+
+        def odd_size(size, minimum):
+            return max(minimum, int(round(size * size_factor)) | 1)
+
+        blur_size, kernel_size = odd_size(5, 3), odd_size(7, 1)
+
+        # A single grayscale buffer is blurred, thresholded and closed in place.
+        work = cv2.cvtColor(search_rgb, cv2.COLOR_RGB2GRAY)
+        del search_rgb
+        cv2.GaussianBlur(work, (blur_size, blur_size), 0, dst=work)
         
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (7, 7))
-        closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=5)
+        cv2.adaptiveThreshold(work, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                              cv2.THRESH_BINARY_INV, 11, 2, dst=work)
         
-        contours, _ = cv2.findContours(closed.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
+        cv2.morphologyEx(work, cv2.MORPH_CLOSE, kernel, dst=work, iterations=5)
+        metrics.add_time("threshold_morphology", time.perf_counter() - threshold_started_at)
         
-        img_h, img_w = image_cv.shape[:2]
-        total_image_area = img_w * img_h
+        contours_started_at = time.perf_counter()
+        # findContours no longer modifies its input (OpenCV >= 3.2), so no copy is needed.
+        contours, _ = cv2.findContours(work, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        del work
+
+        total_image_area = search_w * search_h
         
         min_photo_area_ratio = 0.01
         max_photo_area_ratio = 0.30
         
+        candidates = []
         for contour in sorted(contours, key=cv2.contourArea, reverse=True):
             area = cv2.contourArea(contour)
             
@@ -54,74 +248,185 @@ class ImageProcessor:
                 aspect_ratio = w / float(h)
                 
                 if 0.75 <= aspect_ratio <= 1.35:
-                    candidate_region_cv = image_cv[y:y+h, x:x+w]
-                    
-                    try:
-                        candidate_pil = Image.fromarray(cv2.cvtColor(candidate_region_cv, cv2.COLOR_BGR2RGB))
-                    except cv2.error as cv_err:
-                        print(f"CV Error converting candidate region to PIL: {cv_err}")
-                        continue
+                    if scale < 1.0:
+                        approx = self._refine_quad_corners(image_rgb, approx, scale)
+                        (x, y, w, h) = cv2.boundingRect(approx)
+                    candidates.append((approx, (x, y, w, h)))
+
+        metrics.add_time("contours", time.perf_counter() - contours_started_at)
+        metrics.count("contours", len(contours))
+        metrics.count("candidates", len(candidates))
+        return candidates
+
+    def _refine_quad_corners(self, image_rgb, approx, scale):
+        """
+        Maps corners found on a downscaled copy back to full resolution and snaps
+        each one to the precise corner with sub-pixel refinement, looking only at
+        a small full-resolution patch around it.
+        """
+        img_h, img_w = image_rgb.shape[:2]
+        corners = approx.reshape(-1, 2).astype("float32") / scale
+        radius = int(np.ceil(1.0 / scale)) + 2
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.1)
 
-                    results = self.model(candidate_pil, verbose=False)
+        refined = []
+        for corner_x, corner_y in corners:
+            corner_x = min(max(corner_x, 0.0), img_w - 1.0)
+            corner_y = min(max(corner_y, 0.0), img_h - 1.0)
+            x0 = max(0, int(corner_x) - 2 * radius)
+            y0 = max(0, int(corner_y) - 2 * radius)
+            x1 = min(img_w, int(corner_x) + 2 * radius + 1)
+            y1 = min(img_h, int(corner_y) + 2 * radius + 1)
+            patch = cv2.cvtColor(image_rgb[y0:y1, x0:x1], cv2.COLOR_RGB2GRAY)
+
+            point = np.array([[[corner_x - x0, corner_y - y0]]], dtype="float32")
+            try:
+                # Patches clipped at the image border can be smaller than the search window.
+                if min(patch.shape[:2]) > 2 * radius + 1:
+                    cv2.cornerSubPix(patch, point, (radius, radius), (-1, -1), criteria)
+            except cv2.error:
+                pass
+            refined.append([point[0, 0, 0] + x0, point[0, 0, 1] + y0])
+
+        return np.array(refined, dtype="float32").reshape(-1, 1, 2)
+
+    def _warp_quad(self, image_rgb, approx):
+        """
+        Applies a perspective transform that maps the 4-corner shape onto an
+        upright rectangle. Returns the warped RGB array and the homography M.
+        """
+        pts = approx.reshape(4, 2).astype("float32")
+        
+        rect = np.zeros((4, 2), dtype="float32")
+        s = pts.sum(axis=1)
+        rect[0] = pts[np.argmin(s)]
+        rect[2] = pts[np.argmax(s)]
+        diff = np.diff(pts, axis=1)
+        rect[1] = pts[np.argmin(diff)]
+        rect[3] = pts[np.argmax(diff)]
+        
+        widthA = np.sqrt(((rect[2][0] - rect[3][0]) ** 2) + ((rect[2][1] - rect[3][1]) ** 2))
+        widthB = np.sqrt(((rect[1][0] - rect[0][0]) ** 2) + ((rect[1][1] - rect[0][1]) ** 2))
+        maxWidth = max(int(widthA), int(widthB))
+        
+        heightA = np.sqrt(((rect[1][0] - rect[2][0]) ** 2) + ((rect[1][1] - rect[2][1]) ** 2))
+        heightB = np.sqrt(((rect[0][0] - rect[3][0]) ** 2) + ((rect[0][1] - rect[3][1]) ** 2))
+        maxHeight = max(int(heightA), int(heightB))
+        
+        dst = np.array([
+            [0, 0], [maxWidth - 1, 0], [maxWidth - 1, maxHeight - 1], [0, maxHeight - 1]
+        ], dtype="float32")
+        
+        M = cv2.getPerspectiveTransform(rect, dst)
+        return cv2.warpPerspective(image_rgb, M, (maxWidth, maxHeight)), M
+
+    def _project_face_box(self, face_box, offset, M, warped_size):
+        """
+        Maps a face box found inside a candidate region into the coordinates of
+        the straightened photo. Returns an axis-aligned box clipped to the photo.
+        """
+        x1, y1, x2, y2 = face_box
+        off_x, off_y = offset
+        corners = np.array([
+            [x1 + off_x, y1 + off_y], [x2 + off_x, y1 + off_y],
+            [x2 + off_x, y2 + off_y], [x1 + off_x, y2 + off_y]
+        ], dtype="float32").reshape(-1, 1, 2)
+        
+        projected = cv2.perspectiveTransform(corners, M).reshape(-1, 2)
+        warped_w, warped_h = warped_size
+        
+        return [
+            max(0.0, float(projected[:, 0].min())),
+            max(0.0, float(projected[:, 1].min())),
+            min(float(warped_w), float(projected[:, 0].max())),
+            min(float(warped_h), float(projected[:, 1].max()))
+        ]
+
+    def _find_photo_shape_on_document(self, image_rgb, metrics=None, candidates=None, cancel_token=None):
+        """
+        Finds the physical photo on the document and returns a tuple of the
+        de-skewed PIL image, the validated face box projected into it and the
+        photo's corners. The box is None when reuse is disabled, the validation
+        hit was not confident enough or validation ran at a smaller input size
+        than the crop pass. Returns (None, None, None) when no photo shape is found.
+
+        Candidates are validated in groups of `validation_batch_size` per model call.
+        The winner is still the largest candidate containing a face, so batching
+        only changes how many forward passes are made, not which photo is chosen.
+        `candidates` from an earlier _find_candidate_quads call are reused if given.
+        """
+        metrics = metrics or CallMetrics()
+        if candidates is None:
+            candidates = self._find_candidate_quads(image_rgb, metrics)
+        batch_size = self.validation_batch_size
+
+        for start in range(0, len(candidates), batch_size):
+            batch = []
+            for approx, (x, y, w, h) in candidates[start:start + batch_size]:
+                candidate_pil = Image.fromarray(image_rgb[y:y+h, x:x+w])
+                batch.append((approx, (x, y), candidate_pil))
+
+            if not batch:
+                continue
+
+            batch_images = [candidate_pil for _, _, candidate_pil in batch]
+            detections = self._predict(batch_images, metrics, cancel_token, validation=True)
+            
+            for (approx, offset, _), boxes in zip(batch, detections):
+                if boxes:
+                    with metrics.time("warp"):
+                        warped_rgb, M = self._warp_quad(image_rgb, approx)
+                        warped_pil = Image.fromarray(warped_rgb)
+
+                    face_box = None
+                    confidence = boxes[0][4]
+                    if (self.reuse_validation_detections and self.validation_boxes_precise
+                            and confidence >= self.reuse_min_confidence):
+                        face_box = self._project_face_box(boxes[0][:4], offset, M, warped_pil.size)
                     
-                    if results and results[0].boxes and len(results[0].boxes) > 0:
-                        pts = approx.reshape(4, 2).astype("float32")
-                        
-                        rect = np.zeros((4, 2), dtype="float32")
-                        s = pts.sum(axis=1)
-                        rect[0] = pts[np.argmin(s)]
-                        rect[2] = pts[np.argmax(s)]
-                        diff = np.diff(pts, axis=1)
-                        rect[1] = pts[np.argmin(diff)]
-                        rect[3] = pts[np.argmax(diff)]
-                        
-                        widthA = np.sqrt(((rect[2][0] - rect[3][0]) ** 2) + ((rect[2][1] - rect[3][1]) ** 2))
-                        widthB = np.sqrt(((rect[1][0] - rect[0][0]) ** 2) + ((rect[1][1] - rect[0][1]) ** 2))
-                        maxWidth = max(int(widthA), int(widthB))
-                        
-                        heightA = np.sqrt(((rect[1][0] - rect[2][0]) ** 2) + ((rect[1][1] - rect[2][1]) ** 2))
-                        heightB = np.sqrt(((rect[0][0] - rect[3][0]) ** 2) + ((rect[0][1] - rect[3][1]) ** 2))
-                        maxHeight = max(int(heightA), int(heightB))
-                        
-                        dst = np.array([
-                            [0, 0], [maxWidth - 1, 0], [maxWidth - 1, maxHeight - 1], [0, maxHeight - 1]
-                        ], dtype="float32")
-                        
-                        M = cv2.getPerspectiveTransform(rect, dst)
-                        warped_cv = cv2.warpPerspective(image_cv, M, (maxWidth, maxHeight))
-                        
-                        return Image.fromarray(cv2.cvtColor(warped_cv, cv2.COLOR_BGR2RGB))
-        
-        return None
-
-    def _perform_portrait_crop(self, source_image_pil):
+                    return warped_pil, face_box, approx
+        
+        return None, None, None
+
+    def _perform_portrait_crop(self, source_image_pil, face_box=None, metrics=None):
         """
         Takes a clean image and creates the final, proportionate SQUARE portrait.
+        If a face box (x1, y1, x2, y2) is already known, the model is not run again.
         """
+        metrics = metrics or CallMetrics()
         if source_image_pil.mode != 'RGB':
             source_image_pil = source_image_pil.convert('RGB')
 
-        results = self.model(source_image_pil, verbose=False)
-        
-        if not results or not results[0].boxes or len(results[0].boxes) == 0:
+        if face_box is None:
+            face_box = self._detect_face(source_image_pil, metrics)
+            if face_box is None:
+                return None
+
+        return self._crop_around_face(source_image_pil, face_box, metrics)
+
+    def _detect_face(self, source_image_pil, metrics, cancel_token=None):
+        """Returns the most confident face box (x1, y1, x2, y2) on an RGB image, or None."""
+        boxes = self._predict([source_image_pil], metrics, cancel_token)[0]
+        if not boxes:
             print("INFO: No faces detected in the source image for final cropping.")
             return None
+        return list(boxes[0][:4])
+
+    def _crop_around_face(self, source_image_pil, face_box, metrics):
+        """Cuts the square portrait frame around one face box out of an RGB image."""
+        crop_started_at = time.perf_counter()
 
-        face_box = results[0].boxes[0].xyxy[0].tolist()
         face_x1, face_y1, face_x2, face_y2 = face_box
         face_w = face_x2 - face_x1
         face_h = face_y2 - face_y1
         face_center_x = (face_x1 + face_x2) / 2
 
         # --- DEFINITIVE SQUARE FRAME GEOMETRIC CONSTRUCTION ---
-        headroom_ratio = 0.35
-        shoulder_room_ratio = 0.7
-        headroom = face_h * headroom_ratio
-        shoulder_room = face_h * shoulder_room_ratio
+        headroom = face_h * self.HEADROOM_RATIO
+        shoulder_room = face_h * self.SHOULDER_ROOM_RATIO
         required_height = face_h + headroom + shoulder_room
 
-        horizontal_padding_ratio = 0.4
-        horizontal_padding = face_w * horizontal_padding_ratio
+        horizontal_padding = face_w * self.HORIZONTAL_PADDING_RATIO
         required_width = face_w + (2 * horizontal_padding)
         
         side_length = max(required_height, required_width)
@@ -147,53 +452,442 @@ class ImageProcessor:
         except Exception as crop_err:
             print(f"Error during PIL crop operation: {crop_err}")
             return None
+        finally:
+            metrics.add_time("crop", time.perf_counter() - crop_started_at)
         
         return cropped_image
 
-    def extract_photo(self, image_path_or_pil):
+    def _cache_key(self, image_path_or_pil):
+        """
+        Returns the result cache key for an input: a hash of the raw file bytes for
+        paths, of the decoded pixels for PIL images. None if it cannot be hashed.
+        """
+        if isinstance(image_path_or_pil, str) and os.path.exists(image_path_or_pil):
+            content_digest = hash_file(image_path_or_pil)
+        elif isinstance(image_path_or_pil, Image.Image):
+            content_digest = hash_pil_image(image_path_or_pil)
+        else:
+            return None
+        return ResultCache.make_key(content_digest, self._cache_context)
+
+    def _emit_metrics(self, metrics):
+        record = metrics.as_record()
+        for hook in self.metrics_hooks:
+            try:
+                hook(record)
+            except Exception as hook_err:
+                print(f"Error in metrics hook: {hook_err}")
+
+    def extract_photo(self, image_path_or_pil, progress=None, cancel_token=None):
         """
         Main function. Takes a file path or a PIL Image object and returns the final, 
         cropped PIL image.
+
+        `progress` is called as progress(done, total) after each of the three stages.
+        With a `cancel_token`, OperationCancelled is raised at the next stage or
+        model call once the token is cancelled.
+        """
+        job = self.begin_extraction(image_path_or_pil, cancel_token)
+        if progress:
+            progress(1, 3)
+        self.detect_faces(job)
+        if progress:
+            progress(2, 3)
+        portrait = self.finish_extraction(job)
+        if progress:
+            progress(3, 3)
+        return portrait
+
+    def begin_extraction(self, image_path_or_pil, cancel_token=None):
         """
-        image_cv = None
-        source_image_pil = None
+        First stage of extract_photo: cache lookup, decoding and the contour search
+        for photo shapes. CPU-bound OpenCV work only. Returns a PhotoJob.
+        """
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        job = PhotoJob(image_path_or_pil, cancel_token)
+        metrics = job.metrics
+
+        if self.result_cache is not None:
+            with metrics.time("cache_lookup"):
+                job.cache_key = self._cache_key(image_path_or_pil)
+                hit, cached_portrait = (False, None) if job.cache_key is None else self.result_cache.get(job.cache_key)
+            if hit:
+                print("INFO: Returning cached result for previously processed input.")
+                metrics.count("cache_hits")
+                job.cache_key = None
+                job.portrait, job.done = cached_portrait, True
+                return job
+
+        job.image_rgb, job.source_image_pil, job.view_scale = self._load_image(image_path_or_pil, metrics)
+
+        # --- Stage 1: Find Distinct Photo Shape ---
+        print("INFO: Attempting to find distinct photo shape on document...")
+        job.candidates = self._find_candidate_quads(job.image_rgb, metrics)
+        return job
+
+    def detect_faces(self, job):
+        """
+        Second stage of extract_photo: validates the photo shapes and finds the face
+        to crop around, running every model call of the job. Returns the job.
+        """
+        if job.done:
+            return job
+        metrics = job.metrics
+
+        straightened_photo_pil, face_box, approx = self._find_photo_shape_on_document(
+            job.image_rgb, metrics, job.candidates, job.cancel_token
+        )
+
+        # --- Stage 2: Perform Cropping ---
+        if straightened_photo_pil:
+            print("INFO: Distinct photo shape detected. Proceeding with crop on straightened photo.")
+            if face_box is not None:
+                print("INFO: Reusing the face detected during validation for the final crop.")
+            crop_source = straightened_photo_pil
+        else:
+            print("INFO: No distinct photo shape found. Falling back to processing the full image for face detection.")
+            crop_source, approx = job.source_image_pil, None
+
+        if face_box is None:
+            face_box = self._detect_face(crop_source, metrics, job.cancel_token)
+
+        job.candidates = None
+        if face_box is None:
+            job.done = True
+            job.release_buffers()
+        else:
+            job.crop_source, job.face_box, job.approx = crop_source, face_box, approx
+        return job
+
+    def finish_extraction(self, job):
+        """
+        Last stage of extract_photo: cuts the portrait (at full resolution when the
+        earlier stages worked on a reduced view), stores it in the result cache and
+        reports the job's metrics. Returns the portrait, or None.
+        """
+        metrics = job.metrics
+        if not job.done:
+            if job.cancel_token is not None:
+                job.cancel_token.raise_if_cancelled()
+            crop_source, face_box = job.crop_source, job.face_box
+            if job.view_scale < 1.0:
+                # Detection ran on a reduced view; the portrait is cut from the full-resolution pixels.
+                with metrics.time("full_resolution_decode"):
+                    full_image_pil, full_scale = self._open_full_resolution(job.source)
+                crop_source, face_box = self._to_full_resolution(
+                    full_image_pil, full_scale, job.view_scale, face_box, job.approx, crop_source.size
+                )
+            job.portrait = self._crop_around_face(crop_source, face_box, metrics)
+            job.done = True
+        job.release_buffers()
+
+        if job.cache_key is not None:
+            try:
+                self.result_cache.put(job.cache_key, job.portrait)
+            except OSError as cache_err:
+                print(f"Could not write result to cache: {cache_err}")
+
+        metrics.add_time("total", time.perf_counter() - job.started_at)
+        metrics.count("portraits" if job.portrait is not None else "no_face")
+        self._emit_metrics(metrics)
+        return job.portrait
+
+    def extract_all_photos(self, image_path_or_pil, progress=None, cancel_token=None):
+        """
+        Returns every portrait on an image, e.g. a sheet of ID photos or a group
+        photo, as a list of PIL images in reading order (empty if none is found).
+
+        All photo shapes are validated in batches, and the whole image goes through
+        the model once; every face box of those passes is kept. Faces found more than
+        once (inside a photo shape and on the full image, or in nested shapes) are
+        merged by non-maximum suppression, so N faces cost about one pass instead of N.
+        Faces inside a photo shape are cropped from the straightened photo; when
+        validation runs at a smaller input size than the crop pass, their boxes are
+        re-detected on those photos first (one batched call).
+        The result cache only applies to extract_photo.
+
+        `progress` and `cancel_token` work as in extract_photo; progress is reported
+        after the shape search, the full-image pass and the crops.
+        """
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        metrics = CallMetrics()
+        with metrics.time("total"):
+            image_rgb, source_image_pil, view_scale = self._load_image(image_path_or_pil, metrics)
+
+            # Each face: (box in document pixels, confidence, image to crop from, box in that
+            # image, corners of the photo shape it was found in or None).
+            faces = []
+            shapes = self._find_all_photo_shapes(image_rgb, metrics, cancel_token)
+            for warped_pil, document_boxes, warped_boxes, approx in shapes:
+                for document_box, warped_box in zip(document_boxes, warped_boxes):
+                    faces.append((document_box[:4], document_box[4], warped_pil, warped_box, approx))
+            if progress:
+                progress(1, 3)
+            for box in self._predict([source_image_pil], metrics, cancel_token)[0]:
+                faces.append((box[:4], box[4], source_image_pil, list(box[:4]), None))
+            if progress:
+                progress(2, 3)
+
+            kept = self._suppress_duplicate_faces(faces)
+            if not self.validation_boxes_precise:
+                self._refine_shape_faces(faces, kept, metrics, cancel_token)
+
+            full_image_pil = None
+            portraits = []
+            for i in kept:
+                _, _, crop_source, face_box, approx = faces[i]
+                if view_scale < 1.0:
+                    if full_image_pil is None:
+                        with metrics.time("full_resolution_decode"):
+                            full_image_pil, full_scale = self._open_full_resolution(image_path_or_pil)
+                    crop_source, face_box = self._to_full_resolution(
+                        full_image_pil, full_scale, view_scale, face_box, approx, crop_source.size
+                    )
+                portrait = self._crop_around_face(crop_source, face_box, metrics)
+                if portrait is not None:
+                    portraits.append(portrait)
+            if progress:
+                progress(3, 3)
+
+        metrics.count("faces", len(faces))
+        metrics.count("portraits", len(portraits))
+        if not portraits:
+            metrics.count("no_face")
+        self._emit_metrics(metrics)
+
+        print(f"INFO: {len(portraits)} portrait(s) extracted from {len(faces)} face detection(s).")
+        return portraits
+
+    def _find_all_photo_shapes(self, image_rgb, metrics, cancel_token=None):
+        """
+        Like _find_photo_shape_on_document, but keeps every candidate containing a
+        face. Returns (warped_pil, document_boxes, warped_boxes, approx) tuples, where
+        document_boxes are the validation hits in document pixels (with confidence),
+        warped_boxes the same faces projected into the straightened photo and approx
+        the photo's corners.
+        """
+        candidates = self._find_candidate_quads(image_rgb, metrics)
+        batch_size = self.validation_batch_size
+        shapes = []
+
+        for start in range(0, len(candidates), batch_size):
+            batch = []
+            for approx, (x, y, w, h) in candidates[start:start + batch_size]:
+                candidate_pil = Image.fromarray(image_rgb[y:y+h, x:x+w])
+                batch.append((approx, (x, y), candidate_pil))
+
+            if not batch:
+                continue
+
+            detections = self._predict([candidate_pil for _, _, candidate_pil in batch], metrics, cancel_token,
+                                       validation=True)
+            for (approx, offset, _), boxes in zip(batch, detections):
+                if not boxes:
+                    continue
+                with metrics.time("warp"):
+                    warped_rgb, M = self._warp_quad(image_rgb, approx)
+                    warped_pil = Image.fromarray(warped_rgb)
+
+                off_x, off_y = offset
+                document_boxes = [(x1 + off_x, y1 + off_y, x2 + off_x, y2 + off_y, conf) for x1, y1, x2, y2, conf in boxes]
+                warped_boxes = [self._project_face_box(box[:4], offset, M, warped_pil.size) for box in boxes]
+                shapes.append((warped_pil, document_boxes, warped_boxes, approx))
+
+        return shapes
+
+    def _refine_shape_faces(self, faces, kept, metrics, cancel_token=None):
+        """
+        Replaces the box of each kept face found by a coarse validation pass with the
+        best-matching box of a crop pass over its straightened photo. The faces list
+        is updated in place; a face without a matching box keeps its projected one.
+        """
+        photos = {}
+        for i in kept:
+            if faces[i][4] is not None:
+                photos.setdefault(id(faces[i][2]), faces[i][2])
+        if not photos:
+            return
+
+        detections = dict(zip(photos, self._predict(list(photos.values()), metrics, cancel_token)))
+        for i in kept:
+            document_box, confidence, crop_source, face_box, approx = faces[i]
+            if approx is None:
+                continue
+            boxes = detections[id(crop_source)]
+            best = max(boxes, key=lambda box: self._box_iou(box[:4], face_box), default=None)
+            if best is not None and self._box_iou(best[:4], face_box) > 0.3:
+                faces[i] = (document_box, confidence, crop_source, list(best[:4]), approx)
+
+    @staticmethod
+    def _box_iou(box_a, box_b):
+        ax1, ay1, ax2, ay2 = box_a
+        bx1, by1, bx2, by2 = box_b
+        overlap = max(0.0, min(ax2, bx2) - max(ax1, bx1)) * max(0.0, min(ay2, by2) - max(ay1, by1))
+        union = (ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - overlap
+        return overlap / max(1e-6, union)
+
+    def _suppress_duplicate_faces(self, faces):
+        """
+        Runs non-maximum suppression over (document_box, confidence, ...) tuples.
+        Returns the indices of the faces to keep, sorted top to bottom, then left
+        to right. Of two boxes where one lies inside the other, only the more
+        confident one is kept.
+        """
+        if not faces:
+            return []
+
+        nms_boxes = [[x1, y1, x2 - x1, y2 - y1] for (x1, y1, x2, y2), *_ in faces]
+        scores = [float(confidence) for _, confidence, *_ in faces]
+        kept = [int(i) for i in np.array(cv2.dnn.NMSBoxes(nms_boxes, scores, 0.0, self.multi_face_iou)).reshape(-1)]
+
+        # The same face seen in a tight candidate and on the full page can have a low
+        # IoU while the smaller box still lies almost entirely inside the larger one.
+        kept.sort(key=lambda i: scores[i], reverse=True)
+        unique = []
+        for i in kept:
+            x1, y1, x2, y2 = faces[i][0]
+            area = (x2 - x1) * (y2 - y1)
+            nested = False
+            for j in unique:
+                ox1, oy1, ox2, oy2 = faces[j][0]
+                overlap = max(0.0, min(x2, ox2) - max(x1, ox1)) * max(0.0, min(y2, oy2) - max(y1, oy1))
+                if overlap / max(1e-6, min(area, (ox2 - ox1) * (oy2 - oy1))) > 0.8:
+                    nested = True
+                    break
+            if not nested:
+                unique.append(i)
+
+        unique.sort(key=lambda i: (round(faces[i][0][1]), faces[i][0][0]))
+        return unique
+
+    def _budget_scale(self, width, height, bytes_per_pixel):
+        """Largest scale (at most 1) at which an image of this size fits the memory budget."""
+        if not self.memory_budget_bytes:
+            return 1.0
+        needed = float(width) * height * bytes_per_pixel
+        return min(1.0, (self.memory_budget_bytes / needed) ** 0.5)
+
+    def _decode_reduced(self, pil_image, scale, exact):
+        """
+        Decodes an opened, not yet loaded image at about `scale` of its size and
+        returns (upright RGB image, actual scale). JPEG files are reduced by
+        libjpeg while decoding; with `exact`, anything still larger than asked for
+        is resized down before the full-size buffer is released.
+        """
+        full_w, full_h = pil_image.size
+        orientation = pil_image.getexif().get(0x0112, 1)
+        target_size = (max(1, int(np.ceil(full_w * scale))), max(1, int(np.ceil(full_h * scale))))
+
+        # draft() picks the smallest DCT scale that is still at least target_size.
+        pil_image.draft("RGB", target_size)
+        if exact and pil_image.size[0] > target_size[0] * 1.1:
+            pil_image = pil_image.resize(target_size, Image.BILINEAR, reducing_gap=3.0)
+        actual_scale = pil_image.size[0] / float(full_w)
+
+        # Applied by hand, as the EXIF data does not survive a resize. Matches cv2.imread.
+        if orientation in self.EXIF_TRANSPOSE:
+            pil_image = pil_image.transpose(self.EXIF_TRANSPOSE[orientation])
+        if pil_image.mode != 'RGB':
+            pil_image = pil_image.convert('RGB')
+        return pil_image, actual_scale
+
+    def _load_image(self, image_path_or_pil, metrics):
+        """
+        Decodes the input once and returns (image_rgb, source_image_pil, view_scale):
+        an RGB array for the OpenCV stages, the PIL image it shares its pixels with,
+        and the ratio of their size to the full-resolution image.
+
+        view_scale is below 1 when the input is larger than `draft_max_side` (JPEG
+        files only, decoded at 1/2, 1/4 or 1/8 scale by libjpeg) or than the memory
+        budget allows. The final crop is then cut from the full resolution afterwards.
+        """
+        decode_started_at = time.perf_counter()
+        view_scale = 1.0
 
-        # --- Load and Prepare Image ---
         if isinstance(image_path_or_pil, str): # If input is a file path
             if not os.path.exists(image_path_or_pil):
                 raise FileNotFoundError(f"Image file not found at: {image_path_or_pil}")
-            
-            image_cv = cv2.imread(image_path_or_pil)
-            if image_cv is None:
-                raise ValueError(f"Could not read the image file with OpenCV at: {image_path_or_pil}")
-            
+
             try:
-                source_image_pil = Image.open(image_path_or_pil)
+                opened_image = Image.open(image_path_or_pil)
+                full_w, full_h = opened_image.size
+                draft_scale = 1.0
+                if self.draft_max_side and max(full_w, full_h) > self.draft_max_side:
+                    draft_scale = self.draft_max_side / float(max(full_w, full_h))
+                budget_scale = self._budget_scale(full_w, full_h, self.WORKING_BYTES_PER_PIXEL)
+                source_image_pil, view_scale = self._decode_reduced(
+                    opened_image, min(draft_scale, budget_scale), exact=budget_scale < draft_scale
+                )
             except Exception as pil_err:
                 raise IOError(f"Could not open image file with PIL at {image_path_or_pil}: {pil_err}")
 
         elif isinstance(image_path_or_pil, Image.Image): # If input is already a PIL Image object
             source_image_pil = image_path_or_pil
-            image_cv_array = np.array(source_image_pil)
-            image_cv = cv2.cvtColor(image_cv_array, cv2.COLOR_RGB2BGR) # Convert PIL RGB to OpenCV BGR
+            full_w, full_h = source_image_pil.size
+            budget_scale = self._budget_scale(full_w, full_h, self.WORKING_BYTES_PER_PIXEL)
+            if budget_scale < 1.0:
+                # The caller's image stays the full-resolution source for the final crop.
+                target_size = (max(1, int(full_w * budget_scale)), max(1, int(full_h * budget_scale)))
+                source_image_pil = source_image_pil.resize(target_size, Image.BILINEAR, reducing_gap=3.0)
+                view_scale = source_image_pil.size[0] / float(full_w)
+            if source_image_pil.mode != 'RGB':
+                source_image_pil = source_image_pil.convert('RGB')
         else:
             raise TypeError("Input must be a file path (str) or a PIL Image object.")
 
-        if image_cv is None or source_image_pil is None:
+        image_rgb = np.asarray(source_image_pil)
+        if image_rgb.ndim != 3:
             raise ValueError("Failed to load image data.")
+        if source_image_pil is not image_path_or_pil:
+            # Let the PIL image view the array's pixels instead of holding a second copy.
+            source_image_pil = Image.fromarray(image_rgb)
+        metrics.add_time("decode", time.perf_counter() - decode_started_at)
+        if view_scale < 1.0:
+            metrics.count("reduced_decodes")
+        return image_rgb, source_image_pil, view_scale
 
-        # --- Stage 1: Find Distinct Photo Shape ---
-        print("INFO: Attempting to find distinct photo shape on document...")
-        straightened_photo_pil = self._find_photo_shape_on_document(image_cv)
+    def _open_full_resolution(self, image_path_or_pil):
+        """
+        Returns (image, scale): the input at full resolution for the final crop, or,
+        when even one full-resolution RGB copy would exceed the memory budget, at the
+        largest scale that fits.
+        """
+        if isinstance(image_path_or_pil, Image.Image):
+            full_image_pil = image_path_or_pil
+            return (full_image_pil if full_image_pil.mode == 'RGB' else full_image_pil.convert('RGB')), 1.0
 
-        final_portrait = None
-        # --- Stage 2: Perform Cropping ---
-        if straightened_photo_pil:
-            print("INFO: Distinct photo shape detected. Proceeding with crop on straightened photo.")
-            final_portrait = self._perform_portrait_crop(straightened_photo_pil)
-        else:
-            print("INFO: No distinct photo shape found. Falling back to processing the full image for face detection.")
-            final_portrait = self._perform_portrait_crop(source_image_pil)
-        
-        return final_portrait
+        with Image.open(image_path_or_pil) as opened_image:
+            scale = self._budget_scale(*opened_image.size, 3)
+            if scale < 1.0:
+                print(f"WARNING: Image exceeds the memory budget at full resolution; cropping at {scale:.0%} scale.")
+            full_image_pil, actual_scale = self._decode_reduced(opened_image, scale, exact=True)
+            full_image_pil.load()
+        return full_image_pil, actual_scale
+
+    def _to_full_resolution(self, full_image_pil, full_scale, view_scale, face_box, approx=None, warped_size=None):
+        """
+        Maps a face box found on a reduced view of the input to the (full-resolution)
+        image returned by _open_full_resolution. Without `approx`, the box is on the
+        whole image; with it, the box is on the photo straightened from that quad,
+        which is then straightened again from the higher-resolution pixels.
+        Returns (crop_source_pil, face_box).
+        """
+        ratio = full_scale / view_scale
+        if approx is None:
+            return full_image_pil, [coordinate * ratio for coordinate in face_box]
+
+        # Only the photo's bounding region is copied out of the large image.
+        corners = approx.reshape(-1, 2).astype("float32") * ratio
+        img_w, img_h = full_image_pil.size
+        x0, y0 = (max(0, int(v)) for v in corners.min(axis=0))
+        x1, y1 = min(img_w, int(np.ceil(corners[:, 0].max())) + 1), min(img_h, int(np.ceil(corners[:, 1].max())) + 1)
+        region_rgb = np.asarray(full_image_pil.crop((x0, y0, x1, y1)))
+        warped_rgb, _ = self._warp_quad(region_rgb, corners - np.array([x0, y0], dtype="float32"))
+
+        scale_x = warped_rgb.shape[1] / float(warped_size[0])
+        scale_y = warped_rgb.shape[0] / float(warped_size[1])
+        x1, y1, x2, y2 = face_box
+        return Image.fromarray(warped_rgb), [x1 * scale_x, y1 * scale_y, x2 * scale_x, y2 * scale_y]
 # --- END OF FILE image_processor.py ---
\ No newline at end of file
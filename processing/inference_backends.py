@@ -0,0 +1,418 @@
+import math
+import os
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+# Defaults matching ultralytics' own predict() settings.
+DEFAULT_IMAGE_SIZE = 640
+DEFAULT_CONFIDENCE = 0.25
+DEFAULT_IOU = 0.7
+# Input sizes must be a multiple of the model's largest stride.
+MODEL_STRIDE = 32
+
+class InferenceBackend:
+    """
+    Runs the face detection model on a batch of PIL images.
+
+    predict() returns one list per input image of (x1, y1, x2, y2, confidence)
+    tuples in that image's pixel coordinates, highest confidence first. `imgsz`
+    is the square input size the images are resized to for this call; None uses
+    the size the model was exported with.
+    """
+    name = None
+
+    def predict(self, images, conf=DEFAULT_CONFIDENCE, imgsz=None):
+        raise NotImplementedError
+
+class TorchBackend(InferenceBackend):
+    """The original PyTorch path through ultralytics.YOLO."""
+    name = "torch"
+
+    def __init__(self, model_path):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+
+    def predict(self, images, conf=DEFAULT_CONFIDENCE, imgsz=None):
+        kwargs = {"imgsz": imgsz} if imgsz else {}
+        # A list source makes ultralytics run the whole group as one batch.
+        results = self.model(images if len(images) > 1 else images[0], verbose=False, conf=conf, **kwargs)
+        detections = []
+        for result in results:
+            boxes = []
+            if result.boxes is not None:
+                for xyxy, confidence in zip(result.boxes.xyxy.tolist(), result.boxes.conf.tolist()):
+                    boxes.append((*xyxy, confidence))
+            detections.append(boxes)
+        return detections
+
+class _ExportedYoloBackend(InferenceBackend):
+    """
+    Shared pre- and post-processing for YOLOv8 models exported from ultralytics,
+    so that the exported runtimes do not need torch or ultralytics at all.
+    """
+    def __init__(self, image_size=DEFAULT_IMAGE_SIZE, iou=DEFAULT_IOU):
+        self.image_size = image_size
+        self.iou = iou
+        # Exported graphs with a fixed batch dimension are run one image at a time.
+        self.fixed_batch = False
+        # Graphs exported without dynamic axes only accept the size they were exported with.
+        self.fixed_image_size = None
+        self._warned_fixed_size = False
+
+    def _run(self, batch):
+        raise NotImplementedError
+
+    def _input_size(self, imgsz):
+        """The input size used for a call asking for `imgsz`, rounded up to the model stride."""
+        if self.fixed_image_size:
+            if imgsz and imgsz != self.fixed_image_size and not self._warned_fixed_size:
+                print(f"WARNING: The exported model has a fixed input size of {self.fixed_image_size}; "
+                      f"ignoring the requested size {imgsz}.")
+                self._warned_fixed_size = True
+            return self.fixed_image_size
+        if not imgsz:
+            return self.image_size
+        return max(MODEL_STRIDE, int(math.ceil(imgsz / MODEL_STRIDE)) * MODEL_STRIDE)
+
+    def _letterbox(self, pil_image, size):
+        """Resizes with the aspect ratio kept and pads to a square input, like ultralytics does."""
+        image = np.asarray(pil_image.convert("RGB"))
+        img_h, img_w = image.shape[:2]
+        ratio = min(size / img_h, size / img_w)
+        new_w, new_h = round(img_w * ratio), round(img_h * ratio)
+        pad_x = (size - new_w) / 2
+        pad_y = (size - new_h) / 2
+
+        resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        top, left = round(pad_y - 0.1), round(pad_x - 0.1)
+        bottom, right = size - new_h - top, size - new_w - left
+        padded = cv2.copyMakeBorder(resized, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+        tensor = padded.transpose(2, 0, 1).astype(np.float32) / 255.0
+        return tensor, ratio, (left, top), (img_w, img_h)
+
+    def _decode(self, output, conf, ratio, pad, original_size):
+        """Turns one raw (4 + classes, anchors) output into boxes in original image pixels."""
+        predictions = output.T
+        scores = predictions[:, 4:].max(axis=1)
+        keep = scores >= conf
+        predictions, scores = predictions[keep], scores[keep]
+        if len(predictions) == 0:
+            return []
+
+        cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+        nms_boxes = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1)
+        indices = cv2.dnn.NMSBoxes(nms_boxes.tolist(), scores.tolist(), conf, self.iou)
+        indices = np.array(indices).reshape(-1)
+
+        img_w, img_h = original_size
+        boxes = []
+        for i in indices:
+            x1 = (nms_boxes[i, 0] - pad[0]) / ratio
+            y1 = (nms_boxes[i, 1] - pad[1]) / ratio
+            x2 = x1 + nms_boxes[i, 2] / ratio
+            y2 = y1 + nms_boxes[i, 3] / ratio
+            boxes.append((
+                float(min(max(x1, 0), img_w)), float(min(max(y1, 0), img_h)),
+                float(min(max(x2, 0), img_w)), float(min(max(y2, 0), img_h)),
+                float(scores[i])
+            ))
+        boxes.sort(key=lambda box: box[4], reverse=True)
+        return boxes
+
+    def predict(self, images, conf=DEFAULT_CONFIDENCE, imgsz=None):
+        size = self._input_size(imgsz)
+        prepared = [self._letterbox(image, size) for image in images]
+        tensors = np.stack([tensor for tensor, _, _, _ in prepared])
+
+        if self.fixed_batch:
+            outputs = np.concatenate([self._run(tensors[i:i + 1]) for i in range(len(tensors))])
+        else:
+            outputs = self._run(tensors)
+
+        return [
+            self._decode(output, conf, ratio, pad, original_size)
+            for output, (_, ratio, pad, original_size) in zip(outputs, prepared)
+        ]
+
+class OnnxRuntimeBackend(_ExportedYoloBackend):
+    name = "onnx"
+
+    def __init__(self, onnx_path, image_size=DEFAULT_IMAGE_SIZE, iou=DEFAULT_IOU, threads=None):
+        super().__init__(image_size, iou)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.fixed_batch = isinstance(model_input.shape[0], int)
+        if isinstance(model_input.shape[2], int):
+            self.fixed_image_size = model_input.shape[2]
+
+    def _run(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+class OpenVinoBackend(_ExportedYoloBackend):
+    name = "openvino"
+
+    def __init__(self, model_dir, image_size=DEFAULT_IMAGE_SIZE, iou=DEFAULT_IOU, threads=None):
+        super().__init__(image_size, iou)
+        import openvino as ov
+
+        xml_files = [f for f in os.listdir(model_dir) if f.endswith(".xml")]
+        if not xml_files:
+            raise FileNotFoundError(f"No OpenVINO model (.xml) found in '{model_dir}'.")
+
+        core = ov.Core()
+        model = core.read_model(os.path.join(model_dir, xml_files[0]))
+        input_shape = model.input(0).get_partial_shape()
+        self.fixed_batch = not input_shape[0].is_dynamic
+        if not input_shape[2].is_dynamic:
+            self.fixed_image_size = input_shape[2].get_length()
+        config = {"PERFORMANCE_HINT": "THROUGHPUT"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+        self.compiled_model = core.compile_model(model, "CPU", config)
+        self.output = self.compiled_model.output(0)
+
+    def _run(self, batch):
+        return self.compiled_model(batch)[self.output]
+
+class _BatchRequest:
+    def __init__(self, images, conf, imgsz):
+        self.images = images
+        self.conf = conf
+        self.imgsz = imgsz
+        self.done = threading.Event()
+        self.detections = None
+        self.error = None
+
+class MicroBatchingBackend(InferenceBackend):
+    """
+    Wraps a backend so that predict() calls made concurrently from several threads
+    are grouped into one model call. The first waiting call opens a batch, which is
+    run once it holds `max_batch_size` images or `max_wait_ms` have passed, whichever
+    comes first. Every model call happens on the wrapper's own thread, so the wrapped
+    backend is never used from two threads at once.
+
+    Args:
+        backend (InferenceBackend): The backend running the model.
+        max_batch_size (int): Images above which a batch is run without waiting.
+        max_wait_ms (float): Longest time a call waits for others to join its batch.
+    """
+    def __init__(self, backend, max_batch_size=8, max_wait_ms=10):
+        self.backend = backend
+        self.name = backend.name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.batches = 0
+        self.batched_images = 0
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def predict(self, images, conf=DEFAULT_CONFIDENCE, imgsz=None):
+        request = _BatchRequest(list(images), conf, imgsz)
+        self._requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.detections
+
+    def close(self):
+        """Stops the batching thread once the calls already queued are answered."""
+        self._requests.put(None)
+        self._thread.join()
+
+    def _run(self):
+        closing = False
+        while not closing:
+            request = self._requests.get()
+            if request is None:
+                return
+            batch, image_count = [request], len(request.images)
+            deadline = time.perf_counter() + self.max_wait
+            while image_count < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                batch.append(request)
+                image_count += len(request.images)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # Calls with different confidence thresholds or input sizes cannot share a model call.
+        for conf, imgsz in dict.fromkeys((request.conf, request.imgsz) for request in batch):
+            group = [request for request in batch if (request.conf, request.imgsz) == (conf, imgsz)]
+            images = [image for request in group for image in request.images]
+            try:
+                detections = self.backend.predict(images, conf, imgsz)
+            except Exception as e:
+                for request in group:
+                    request.error = e
+                    request.done.set()
+                continue
+
+            self.batches += 1
+            self.batched_images += len(images)
+            start = 0
+            for request in group:
+                request.detections = detections[start:start + len(request.images)]
+                start += len(request.images)
+                request.done.set()
+
+def _is_stale(artifact_path, model_path):
+    return not os.path.exists(artifact_path) or os.path.getmtime(artifact_path) < os.path.getmtime(model_path)
+
+# Number of images the ONNX INT8 activation ranges are calibrated on.
+CALIBRATION_IMAGES = 64
+_CALIBRATION_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+def _calibration_image_paths(calibration_data):
+    """
+    Lists the calibration images of a directory, or of the val (else train) split
+    of an ultralytics dataset YAML, whose paths are relative to its `path` entry.
+    """
+    if os.path.isdir(calibration_data):
+        sources = [calibration_data]
+    else:
+        import yaml
+        with open(calibration_data, encoding="utf-8") as f:
+            dataset = yaml.safe_load(f) or {}
+        root = os.path.join(os.path.dirname(os.path.abspath(calibration_data)), str(dataset.get("path", "")))
+        split = dataset.get("val") or dataset.get("train") or []
+        sources = [os.path.join(root, str(entry)) for entry in (split if isinstance(split, list) else [split])]
+
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            for dir_path, _, file_names in os.walk(source):
+                paths.extend(os.path.join(dir_path, name) for name in file_names
+                             if name.lower().endswith(_CALIBRATION_EXTENSIONS))
+        elif source.endswith(".txt"):
+            # A text file listing one image path per line, relative to the file.
+            with open(source, encoding="utf-8") as f:
+                paths.extend(os.path.join(os.path.dirname(source), line.strip()) for line in f if line.strip())
+    if not paths:
+        raise FileNotFoundError(f"No calibration images found in '{calibration_data}'.")
+    return sorted(paths)[:CALIBRATION_IMAGES]
+
+def _quantize_onnx_static(onnx_path, int8_path, calibration_data):
+    """
+    Quantizes weights and activations to INT8 in QDQ format. Unlike dynamic
+    quantization, which turns the convolutions into ConvInteger (slower than FP32
+    on the CPU provider), the QDQ graph runs on ONNX Runtime's fused INT8 kernels.
+    """
+    import tempfile
+    from PIL import Image
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    input_name = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    letterbox = _ExportedYoloBackend()._letterbox
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self, image_paths):
+            self._image_paths = iter(image_paths)
+
+        def get_next(self):
+            image_path = next(self._image_paths, None)
+            if image_path is None:
+                return None
+            with Image.open(image_path) as image:
+                tensor = letterbox(image, DEFAULT_IMAGE_SIZE)[0]
+            return {input_name: tensor[np.newaxis]}
+
+    image_paths = _calibration_image_paths(calibration_data)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        prepared_path = os.path.join(temp_dir, "prepared.onnx")
+        quant_pre_process(onnx_path, prepared_path, skip_symbolic_shape=True)
+        quantize_static(prepared_path, int8_path, _Reader(image_paths), quant_format=QuantFormat.QDQ,
+                        per_channel=True, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+def prepare_model_artifact(model_path, backend, int8=False, calibration_data=None):
+    """
+    Converts the PyTorch weights for the selected backend, once, and caches the
+    result next to them (e.g. data/models/model.onnx). The conversion needs
+    ultralytics; running the converted artifact does not. Artifacts older than
+    the weights are rebuilt.
+
+    Args:
+        model_path (str): Path to the .pt weights.
+        backend (str): One of BACKENDS.
+        int8 (bool): Produce an INT8-quantized artifact.
+        calibration_data (str): Dataset YAML (ultralytics format) or directory of
+                                images used to calibrate INT8 quantization. ONNX
+                                INT8 needs it; without it the FP32 model is used.
+
+    Returns:
+        str: Path to the file or directory the backend should load.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Choose one of: {', '.join(BACKENDS)}.")
+
+    base_path = os.path.splitext(model_path)[0]
+
+    if backend == "torch":
+        return model_path
+
+    if backend == "onnx":
+        onnx_path = base_path + ".onnx"
+        if _is_stale(onnx_path, model_path):
+            from ultralytics import YOLO
+            print(f"INFO: Exporting model to ONNX at '{onnx_path}' (one-time step)...")
+            onnx_path = YOLO(model_path).export(format="onnx", dynamic=True, simplify=True, imgsz=DEFAULT_IMAGE_SIZE)
+        if not int8:
+            return onnx_path
+
+        int8_path = base_path + ".int8.qdq.onnx"
+        if _is_stale(int8_path, model_path):
+            if not calibration_data:
+                print("WARNING: ONNX INT8 quantization needs calibration images (--calibration-data); using FP32.")
+                return onnx_path
+            print(f"INFO: Quantizing ONNX model to INT8 at '{int8_path}' (one-time step)...")
+            _quantize_onnx_static(onnx_path, int8_path, calibration_data)
+        return int8_path
+
+    model_dir = base_path + ("_int8_openvino_model" if int8 else "_openvino_model")
+    if _is_stale(model_dir, model_path):
+        from ultralytics import YOLO
+        print(f"INFO: Exporting model to OpenVINO at '{model_dir}' (one-time step)...")
+        export_kwargs = {"format": "openvino", "dynamic": True, "int8": int8, "imgsz": DEFAULT_IMAGE_SIZE}
+        if int8 and calibration_data:
+            export_kwargs["data"] = calibration_data
+        model_dir = YOLO(model_path).export(**export_kwargs)
+    return model_dir
+
+def create_backend(model_path, backend="torch", int8=False, calibration_data=None, threads=None):
+    """
+    Builds the inference backend selected by name, converting the weights first
+    if needed. See prepare_model_artifact for the arguments. `threads` caps the
+    intra-op threads of the onnx and openvino runtimes; torch's are set process-wide
+    by processing.processor_pool.configure_threads.
+    """
+    artifact_path = prepare_model_artifact(model_path, backend, int8, calibration_data)
+
+    if backend == "torch":
+        if int8:
+            print("WARNING: INT8 quantization is only available for the onnx and openvino backends; using FP32.")
+        return TorchBackend(artifact_path)
+    if backend == "onnx":
+        return OnnxRuntimeBackend(artifact_path, threads=threads)
+    return OpenVinoBackend(artifact_path, threads=threads)
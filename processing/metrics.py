@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class CallMetrics:
+    """
+    Timings and counts collected during a single ImageProcessor.extract_photo call.
+
+    Stage durations are accumulated per stage name; every model call is also
+    recorded individually. as_record() returns a plain, picklable dict, which is
+    what metrics hooks receive.
+    """
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.model_call_seconds = []
+
+    @contextmanager
+    def time(self, stage):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - started_at)
+
+    def add_time(self, stage, seconds):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_model_call(self, seconds, images):
+        self.model_call_seconds.append(seconds)
+        self.count("model_calls")
+        self.count("model_images", images)
+
+    def as_record(self):
+        return {
+            "timings": dict(self.timings),
+            "counters": dict(self.counters),
+            "model_call_seconds": list(self.model_call_seconds),
+        }
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[i] += 1
+
+class MetricsRegistry:
+    """
+    Aggregates extract_photo call records into counters and per-stage latency
+    histograms, and renders them as Prometheus text or JSON lines. Safe to feed
+    from several threads; records produced in worker processes can be observed
+    in the parent, as they are plain dicts.
+    """
+    PREFIX = "image_extractor"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.counters = {}
+            self.stage_histograms = {}
+            self.model_call_histogram = _Histogram(self.buckets)
+
+    def observe(self, record):
+        """Adds one call record, as produced by CallMetrics.as_record()."""
+        with self._lock:
+            self.calls += 1
+            for name, amount in record.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            for stage, seconds in record.get("timings", {}).items():
+                if stage not in self.stage_histograms:
+                    self.stage_histograms[stage] = _Histogram(self.buckets)
+                self.stage_histograms[stage].observe(seconds)
+            for seconds in record.get("model_call_seconds", []):
+                self.model_call_histogram.observe(seconds)
+
+    def _histogram_lines(self, name, histogram, labels=""):
+        separator = "," if labels else ""
+        lines = []
+        for upper_bound, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{upper_bound}"}} {bucket_count}')
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {histogram.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {histogram.count}")
+        return lines
+
+    def to_prometheus(self):
+        """Renders all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                f"# HELP {self.PREFIX}_calls_total Number of extract_photo calls.",
+                f"# TYPE {self.PREFIX}_calls_total counter",
+                f"{self.PREFIX}_calls_total {self.calls}",
+            ]
+            for name in sorted(self.counters):
+                metric = f"{self.PREFIX}_{name}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {self.counters[name]}"]
+
+            metric = f"{self.PREFIX}_stage_seconds"
+            lines += [f"# HELP {metric} Time spent per pipeline stage and call.", f"# TYPE {metric} histogram"]
+            for stage in sorted(self.stage_histograms):
+                lines += self._histogram_lines(metric, self.stage_histograms[stage], f'stage="{stage}"')
+
+            metric = f"{self.PREFIX}_model_call_seconds"
+            lines += [f"# HELP {metric} Duration of individual model calls.", f"# TYPE {metric} histogram"]
+            lines += self._histogram_lines(metric, self.model_call_histogram)
+        return "\n".join(lines) + "\n"
+
+    def to_json_lines(self):
+        """Renders all metrics as JSON lines, one object per counter or histogram."""
+        with self._lock:
+            entries = [{"metric": "calls", "type": "counter", "value": self.calls}]
+            for name in sorted(self.counters):
+                entries.append({"metric": name, "type": "counter", "value": self.counters[name]})
+
+            histograms = [({"stage": stage}, self.stage_histograms[stage]) for stage in sorted(self.stage_histograms)]
+            histograms.append(({"stage": "model_call"}, self.model_call_histogram))
+            for labels, histogram in histograms:
+                entries.append({
+                    "metric": "stage_seconds", "type": "histogram", "labels": labels,
+                    "count": histogram.count, "sum": round(histogram.sum, 6),
+                    "buckets": dict(zip((str(b) for b in histogram.buckets), histogram.bucket_counts)),
+                })
+        return "".join(json.dumps(entry, sort_keys=True) + "\n" for entry in entries)
+
+    def write(self, path, fmt="prometheus"):
+        """Writes the metrics to a file, as 'prometheus' text or 'jsonl'."""
+        text = self.to_prometheus() if fmt == "prometheus" else self.to_json_lines()
+        with open(path, "w") as f:
+            f.write(text)
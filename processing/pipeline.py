@@ -0,0 +1,209 @@
+import queue
+import threading
+
+# Marks the end of the input on a stage's queue.
+_END = object()
+
+class _Failure:
+    """Carries an exception raised by a stage to the consumer, in input order."""
+    def __init__(self, error):
+        self.error = error
+
+class StagedPipeline:
+    """
+    Runs items through a sequence of stages, each with its own pool of threads,
+    connected by bounded queues. A full queue blocks the stage feeding it, so a
+    fast producer cannot race ahead of a slow stage, and the number of items in
+    flight is capped by the queue sizes plus the workers.
+
+    OpenCV, PIL and the inference runtimes release the GIL during their heavy
+    work, so the stages overlap and throughput approaches that of the slowest
+    stage rather than the sum of all of them.
+
+    Args:
+        stages (list): (name, function, workers) tuples. Each function takes the
+                       output of the previous stage and returns its own output.
+        queue_size (int): Capacity of each queue between two stages.
+    """
+    def __init__(self, stages, queue_size=4):
+        self.stages = list(stages)
+        self.queue_size = max(1, queue_size)
+
+    def run(self, items):
+        """
+        Feeds `items` through the stages and yields the results in input order.
+        An exception raised by a stage for an item is re-raised when that item's
+        turn comes. Closing the generator early stops every worker. In every case,
+        run() only returns once all of its threads have finished, so no stage is
+        still using a shared object (e.g. a pooled ImageProcessor) afterwards.
+        """
+        stop = threading.Event()
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+
+        def put(target_queue, entry):
+            # Gives up when the consumer has gone away, instead of blocking forever.
+            while not stop.is_set():
+                try:
+                    target_queue.put(entry, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(source_queue):
+            while not stop.is_set():
+                try:
+                    return source_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return None
+
+        def feed():
+            sequence = 0
+            try:
+                for item in items:
+                    if not put(queues[0], (sequence, item)):
+                        return
+                    sequence += 1
+            except Exception as e:
+                # A failing source ends the input; the error surfaces after the items before it.
+                put(queues[0], (sequence, _Failure(e)))
+            put(queues[0], _END)
+
+        def work(function, source, target, finished, workers_left):
+            while True:
+                entry = get(source)
+                if entry is None:
+                    return
+                if entry is _END:
+                    # The last worker of a stage passes the end marker on.
+                    source.put(_END)
+                    with finished:
+                        workers_left[0] -= 1
+                        last = workers_left[0] == 0
+                    if last:
+                        put(target, _END)
+                    return
+
+                sequence, value = entry
+                if not isinstance(value, _Failure) and not stop.is_set():
+                    try:
+                        value = function(value)
+                    except Exception as e:
+                        value = _Failure(e)
+                if not put(target, (sequence, value)):
+                    return
+
+        threads = [threading.Thread(target=feed, name="pipeline-feed", daemon=True)]
+        for index, (name, function, workers) in enumerate(self.stages):
+            workers = max(1, workers)
+            finished, workers_left = threading.Lock(), [workers]
+            for worker in range(workers):
+                threads.append(threading.Thread(
+                    target=work, name=f"pipeline-{name}-{worker}", daemon=True,
+                    args=(function, queues[index], queues[index + 1], finished, workers_left)
+                ))
+        for thread in threads:
+            thread.start()
+
+        # Stages with several workers finish items out of order; hold them until their turn.
+        held = {}
+        next_sequence = 0
+        try:
+            while True:
+                entry = queues[-1].get()
+                if entry is _END:
+                    break
+                sequence, value = entry
+                held[sequence] = value
+                while next_sequence in held:
+                    value = held.pop(next_sequence)
+                    next_sequence += 1
+                    if isinstance(value, _Failure):
+                        raise value.error
+                    yield value
+        finally:
+            stop.set()
+            # Workers notice the stop within one queue timeout; one busy in a stage
+            # finishes that call first (a cancelled token cuts it short).
+            for thread in threads:
+                thread.join()
+
+class DocumentPipeline:
+    """
+    Extracts the portraits of a stream of document images with one ImageProcessor,
+    overlapping the stages of consecutive images:
+
+        extract  - pulls and decodes the next image from the document
+        shapes   - cache lookup, decoding and the contour search (OpenCV)
+        inference - every model call of an image
+        crop     - full-resolution mapping and the final crop
+        encode   - optional, e.g. JPEG encoding of the portrait
+
+    Only the inference stage touches the model, and it runs on a single thread by
+    default, as the PyTorch backend is not safe to call from several threads.
+
+    Args:
+        processor (ImageProcessor): A loaded processor.
+        shape_workers (int): Threads running the contour search.
+        inference_workers (int): Threads running the model.
+        crop_workers (int): Threads cutting the portraits.
+        encode_workers (int): Threads running `encode`.
+        queue_size (int): Capacity of the queue between two stages.
+    """
+    def __init__(self, processor, shape_workers=1, inference_workers=1, crop_workers=1,
+                 encode_workers=1, queue_size=4):
+        self.processor = processor
+        self.shape_workers = shape_workers
+        self.inference_workers = inference_workers
+        self.crop_workers = crop_workers
+        self.encode_workers = encode_workers
+        self.queue_size = queue_size
+
+    @staticmethod
+    def _decoded(pil_image):
+        pil_image.load()
+        return pil_image
+
+    def iter_extract_photos(self, images, all_faces=False, encode=None, cancel_token=None):
+        """
+        Runs the extraction on every image, with the stages overlapped.
+
+        Args:
+            images (iterable): PIL Image objects, in document order. The iterable is
+                               consumed on the pipeline's extract thread.
+            all_faces (bool): Use extract_all_photos. It runs as a single stage, still
+                              overlapped with extraction and encoding.
+            encode (callable): Optional function applied to each result (a portrait,
+                               None, or with `all_faces` a list) in a stage of its own.
+            cancel_token (CancellationToken): Checked before each image is pulled from
+                                              the document and by every stage. Once it
+                                              is cancelled, OperationCancelled is raised.
+
+        Yields:
+            The result for each image, in the same order as the input.
+        """
+        processor = self.processor
+        if all_faces:
+            def extract_all(pil_image):
+                return processor.extract_all_photos(pil_image, cancel_token=cancel_token)
+            stages = [("inference", extract_all, self.inference_workers)]
+        else:
+            def begin(pil_image):
+                return processor.begin_extraction(pil_image, cancel_token)
+            stages = [
+                ("shapes", begin, self.shape_workers),
+                ("inference", processor.detect_faces, self.inference_workers),
+                ("crop", processor.finish_extraction, self.crop_workers),
+            ]
+        if encode is not None:
+            stages.append(("encode", encode, self.encode_workers))
+
+        def decoded_images():
+            for pil_image in images:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                yield self._decoded(pil_image)
+
+        pipeline = StagedPipeline(stages, self.queue_size)
+        return pipeline.run(decoded_images())
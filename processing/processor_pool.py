@@ -0,0 +1,161 @@
+import os
+import threading
+from contextlib import contextmanager
+from processing.image_processor import ImageProcessor
+
+def threads_per_instance(instances, cores=None):
+    """
+    Splits the CPU cores evenly between `instances` models running at the same
+    time (threads, or worker processes), so that together they use every core
+    without oversubscribing them.
+    """
+    return max(1, (cores or os.cpu_count() or 1) // max(1, instances))
+
+def configure_threads(intra_op_threads, opencv_threads=None, inter_op_threads=None):
+    """
+    The one place where the thread pools of the libraries are sized, for the
+    current process.
+
+    Args:
+        intra_op_threads (int): Threads one model call may use. torch applies it to
+                                every call in the process, so with several models
+                                running at once it is their per-instance share. The
+                                onnx and openvino backends take it per instance
+                                instead, through ImageProcessor(intra_op_threads=...).
+        opencv_threads (int): Threads of OpenCV's own parallel loops. Defaults to
+                              `intra_op_threads`.
+        inter_op_threads (int): Threads torch uses to run independent operators of
+                                one graph in parallel. Left unchanged when None, and
+                                ignored once torch has started its thread pool.
+    """
+    import cv2
+
+    cv2.setNumThreads(opencv_threads if opencv_threads is not None else intra_op_threads)
+    try:
+        import torch
+    except ImportError:
+        # The exported backends run without torch.
+        return
+    torch.set_num_threads(intra_op_threads)
+    if inter_op_threads is not None:
+        try:
+            torch.set_interop_threads(inter_op_threads)
+        except RuntimeError:
+            print("WARNING: torch inter-op threads can only be set before the first parallel work; keeping the current value.")
+
+class ProcessorPool:
+    """
+    A fixed number of loaded ImageProcessors, handed out to jobs with checkout().
+
+    By default a processor serves one job at a time, so the model of a processor is
+    never used from two threads at once. A processor whose backend batches calls
+    from several threads (MicroBatchingBackend) can serve up to
+    `jobs_per_processor` jobs at once; a job gets the least busy processor.
+
+    reload() loads a new set of processors while the current ones keep serving,
+    swaps them in, and returns once the jobs still running on the old ones have
+    finished, so a reload never pulls a model from under a running job.
+
+    Args:
+        processor_kwargs (dict): Keyword arguments for each ImageProcessor.
+        size (int): Number of processors, i.e. of models in memory.
+        jobs_per_processor (int): Jobs a processor may serve at the same time.
+        threads_per_processor (int): Intra-op threads of each model. Defaults to an
+                                     even share of the CPU cores.
+        wrap_backend (callable): Optional function applied to each processor's
+                                 backend, e.g. to add a MicroBatchingBackend.
+        warm_up (bool): Run one inference on each new processor before use.
+    """
+    def __init__(self, processor_kwargs=None, size=1, jobs_per_processor=1, threads_per_processor=None,
+                 wrap_backend=None, warm_up=True):
+        self.processor_kwargs = dict(processor_kwargs or {})
+        self.size = max(1, size)
+        self.jobs_per_processor = max(1, jobs_per_processor)
+        self.threads_per_processor = threads_per_processor or threads_per_instance(self.size)
+        self.wrap_backend = wrap_backend
+        self._condition = threading.Condition()
+        # Processor -> number of jobs it is serving.
+        self._active = {}
+        self._closed = False
+        self._processors = self._load(self.processor_kwargs, warm_up)
+
+    @property
+    def processors(self):
+        with self._condition:
+            return list(self._processors)
+
+    def _load(self, processor_kwargs, warm_up):
+        configure_threads(self.threads_per_processor)
+        processors = []
+        for _ in range(self.size):
+            processor = ImageProcessor(**processor_kwargs, intra_op_threads=self.threads_per_processor)
+            if self.wrap_backend is not None:
+                processor.backend = self.wrap_backend(processor.backend)
+            if warm_up:
+                processor.warm_up()
+            processors.append(processor)
+        return processors
+
+    def warm_up(self):
+        """Runs one inference on every processor. Returns the time taken in seconds."""
+        return sum(processor.warm_up() for processor in self.processors)
+
+    @contextmanager
+    def checkout(self):
+        """Waits for a processor with a free job slot and holds the slot for the block."""
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("The processor pool has been closed.")
+                available = [p for p in self._processors if self._active.get(p, 0) < self.jobs_per_processor]
+                if available:
+                    break
+                self._condition.wait()
+            processor = min(available, key=lambda p: self._active.get(p, 0))
+            self._active[processor] = self._active.get(processor, 0) + 1
+
+        try:
+            yield processor
+        finally:
+            with self._condition:
+                self._active[processor] -= 1
+                if not self._active[processor]:
+                    del self._active[processor]
+                self._condition.notify_all()
+
+    def _drain(self, processors):
+        # Called with the condition held.
+        while any(processor in self._active for processor in processors):
+            self._condition.wait()
+
+    @staticmethod
+    def _release(processors):
+        for processor in processors:
+            close = getattr(processor.backend, "close", None)
+            if close is not None:
+                close()
+
+    def reload(self, processor_kwargs=None):
+        """
+        Replaces every processor with a newly loaded one, e.g. after the weights
+        changed, or with other settings when `processor_kwargs` is given. New jobs
+        get the new processors as soon as they are ready.
+        """
+        processor_kwargs = dict(processor_kwargs) if processor_kwargs is not None else self.processor_kwargs
+        new_processors = self._load(processor_kwargs, warm_up=True)
+        with self._condition:
+            old_processors = self._processors
+            self._processors = new_processors
+            self.processor_kwargs = processor_kwargs
+            self._condition.notify_all()
+            self._drain(old_processors)
+        self._release(old_processors)
+
+    def close(self):
+        """Refuses new jobs and waits for the running ones to finish."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            self._drain(self._processors)
+            processors = self._processors
+        self._release(processors)
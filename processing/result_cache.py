@@ -0,0 +1,166 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from PIL import Image
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file's raw bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_pil_image(pil_image):
+    """Returns the SHA-256 hex digest of a PIL image's decoded pixels."""
+    digest = hashlib.sha256()
+    digest.update(f"{pil_image.mode}:{pil_image.size[0]}x{pil_image.size[1]}:".encode())
+    digest.update(pil_image.tobytes())
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    A persistent, content-addressed cache of extract_photo results.
+
+    Each entry is a file named after its key: '<key>.png' holds the extracted
+    portrait, '<key>.none' records that no usable face was found. Entries are
+    written atomically, so several processes can share the same directory. When
+    the cache grows beyond `max_bytes`, the least recently used entries (by
+    modification time, which is refreshed on every hit) are evicted.
+    """
+    PORTRAIT_SUFFIX = ".png"
+    NO_FACE_SUFFIX = ".none"
+    TEMP_SUFFIX = ".tmp"
+    # Temporary files older than this were left behind by a writer that died; younger
+    # ones may belong to another process writing to the same directory right now.
+    ORPHAN_TEMP_AGE_SECONDS = 3600
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._remove_orphaned_temp_files()
+        self._total_bytes = sum(size for _, size, _ in self._scan_entries())
+
+    @staticmethod
+    def make_key(*parts):
+        """Combines content and configuration digests into a single cache key."""
+        return hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()
+
+    def _remove_orphaned_temp_files(self):
+        cutoff = time.time() - self.ORPHAN_TEMP_AGE_SECONDS
+        for dir_path, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if not file_name.endswith(self.TEMP_SUFFIX):
+                    continue
+                temp_path = os.path.join(dir_path, file_name)
+                try:
+                    if os.path.getmtime(temp_path) < cutoff:
+                        os.remove(temp_path)
+                except OSError:
+                    continue
+
+    @staticmethod
+    def _size_or_zero(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _entry_path(self, key, suffix):
+        # Entries are spread over 256 sub-directories to keep listings short.
+        return os.path.join(self.cache_dir, key[:2], key + suffix)
+
+    def get(self, key):
+        """
+        Looks up a cached result.
+
+        Returns:
+            tuple: (hit, portrait). `portrait` is a PIL Image, or None when the
+                   cached verdict is that the input contains no usable face.
+        """
+        for suffix in (self.PORTRAIT_SUFFIX, self.NO_FACE_SUFFIX):
+            entry_path = self._entry_path(key, suffix)
+            if not os.path.exists(entry_path):
+                continue
+
+            try:
+                portrait = None
+                if suffix == self.PORTRAIT_SUFFIX:
+                    with Image.open(entry_path) as cached:
+                        portrait = cached.convert("RGB")
+                os.utime(entry_path)
+                return True, portrait
+            except OSError:
+                # Evicted by another process, or a damaged entry: treat as a miss.
+                continue
+        return False, None
+
+    def put(self, key, portrait):
+        """Stores a portrait, or a 'no face' verdict when `portrait` is None."""
+        suffix = self.NO_FACE_SUFFIX if portrait is None else self.PORTRAIT_SUFFIX
+        entry_path = self._entry_path(key, suffix)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), suffix=self.TEMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if portrait is None:
+                    f.write(b"no-face\n")
+                else:
+                    portrait.save(f, "PNG")
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+        # A result stored again replaces the earlier entry under the same key, with
+        # either suffix, so its size is counted once and a stale verdict cannot win.
+        other_path = self._entry_path(key, self.PORTRAIT_SUFFIX if portrait is None else self.NO_FACE_SUFFIX)
+        with self._lock:
+            replaced_bytes = self._size_or_zero(entry_path) + self._size_or_zero(other_path)
+            try:
+                os.replace(temp_path, entry_path)
+            except OSError:
+                os.remove(temp_path)
+                raise
+            try:
+                os.remove(other_path)
+            except FileNotFoundError:
+                pass
+            self._total_bytes += os.path.getsize(entry_path) - replaced_bytes
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan_entries(self):
+        entries = []
+        for dir_path, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if not file_name.endswith((self.PORTRAIT_SUFFIX, self.NO_FACE_SUFFIX)):
+                    continue
+                entry_path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+        return entries
+
+    def _evict(self):
+        """Removes least recently used entries until the cache is at 90% of its budget."""
+        entries = sorted(self._scan_entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+
+        for _, size, entry_path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        self._total_bytes = total
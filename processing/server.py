@@ -0,0 +1,266 @@
+import io
+import json
+import os
+import tempfile
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+from PIL import Image
+from processing.batch import extract_portraits_from_file
+from processing.inference_backends import MicroBatchingBackend
+from processing.metrics import MetricsRegistry
+from processing.processor_pool import ProcessorPool
+from utils.file_naming import build_portrait_filename
+from utils.portrait_export import encode_portrait, export_portraits
+from utils.logging_config import log_message
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# PIL format name -> file extension used for uploaded images.
+_IMAGE_FORMAT_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "BMP": ".bmp"}
+
+class UnsupportedUpload(ValueError):
+    """Raised for an upload that is not a supported image, PDF or DOCX file."""
+
+def sniff_extension(data):
+    """Returns the file extension matching the content of an upload."""
+    if data.startswith(b"%PDF"):
+        return ".pdf"
+    if data.startswith(b"PK\x03\x04"):
+        # A DOCX file is a ZIP package with a content types part and a word/ folder;
+        # any other ZIP file is rejected here rather than read as an empty document.
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                names = archive.namelist()
+        except zipfile.BadZipFile:
+            names = []
+        if "[Content_Types].xml" in names and any(name.startswith("word/") for name in names):
+            return ".docx"
+        raise UnsupportedUpload("The upload is a ZIP file, but not a Word (DOCX) document.")
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format = image.format
+    except Exception:
+        image_format = None
+    if image_format not in _IMAGE_FORMAT_EXTENSIONS:
+        raise UnsupportedUpload("The upload is not a supported image, PDF or DOCX file.")
+    return _IMAGE_FORMAT_EXTENSIONS[image_format]
+
+def content_disposition(file_name):
+    """
+    Builds an attachment Content-Disposition header value. The quoted filename is an
+    ASCII fallback; the real name is sent UTF-8 encoded as an RFC 5987 filename*.
+    """
+    fallback = "".join(char if 32 <= ord(char) < 127 and char not in '"\\' else "_"
+                       for char in file_name)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(file_name, safe='')}"
+
+class ExtractionService:
+    """
+    Keeps one or more warmed-up ImageProcessors resident and extracts portraits
+    from uploaded files. The model of each processor sits behind a
+    MicroBatchingBackend, so the model calls of concurrent requests are grouped
+    into batches. Each request goes to the least busy processor of a ProcessorPool,
+    which serves up to `max_batch_size` requests at once.
+
+    Args:
+        processor_kwargs (dict): Keyword arguments for each ImageProcessor.
+        models (int): Number of resident processors, each with its own model.
+        max_batch_size (int): Images per micro-batch before it runs without waiting.
+        max_wait_ms (float): Longest time a model call waits for others to join it.
+        threads_per_model (int): Intra-op threads of each model. Defaults to an even
+                                 share of the CPU cores.
+        document_kwargs (dict): Extra keyword arguments for iter_images_from_document.
+        pipeline_kwargs (dict): Extra keyword arguments for DocumentPipeline.
+        metrics (MetricsRegistry): Receives the metrics of every extraction.
+    """
+    def __init__(self, processor_kwargs=None, models=1, max_batch_size=8, max_wait_ms=10,
+                 document_kwargs=None, pipeline_kwargs=None, metrics=None, threads_per_model=None):
+        self.document_kwargs = document_kwargs or {}
+        self.pipeline_kwargs = pipeline_kwargs or {}
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+
+        def micro_batching(backend):
+            return MicroBatchingBackend(backend, max_batch_size, max_wait_ms)
+
+        self.pool = ProcessorPool(
+            {**(processor_kwargs or {}), "metrics_hooks": [self.metrics.observe]}, size=models,
+            jobs_per_processor=max_batch_size, threads_per_processor=threads_per_model, wrap_backend=micro_batching
+        )
+
+    def extract(self, data, all_faces=False):
+        """
+        Extracts the portraits of one uploaded file.
+
+        Args:
+            data (bytes): The content of an image, PDF or DOCX file.
+            all_faces (bool): Extract every portrait of each image, not just one.
+
+        Returns:
+            list: The portraits as PIL Image objects, in document order.
+        """
+        extension = sniff_extension(data)
+
+        # The document readers open files by path. The file is closed before it is
+        # opened again, as Windows does not allow a second handle on it.
+        temp_file = tempfile.NamedTemporaryFile(suffix=extension, delete=False)
+        try:
+            with temp_file:
+                temp_file.write(data)
+            with self.pool.checkout() as processor:
+                return extract_portraits_from_file(processor, temp_file.name, self.document_kwargs, all_faces,
+                                                   pipeline_kwargs=self.pipeline_kwargs)
+        finally:
+            os.remove(temp_file.name)
+
+    def status(self):
+        processors = self.pool.processors
+        return {
+            "status": "ok",
+            "models": len(processors),
+            "threads_per_model": self.pool.threads_per_processor,
+            "extractions": self.metrics.calls,
+            "model_batches": sum(processor.backend.batches for processor in processors),
+            "model_images": sum(processor.backend.batched_images for processor in processors),
+        }
+
+    def reload(self):
+        """Reloads every model without dropping requests; running ones finish on the old models."""
+        self.pool.reload()
+
+    def close(self):
+        self.pool.close()
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health    - service status as JSON
+    GET  /metrics   - per-stage metrics in the Prometheus text format
+    POST /extract   - the request body is an image, PDF or DOCX file. Query parameters:
+                      all_faces=1, format=auto|jpeg|zip, quality=1-100, filename=<name>.
+                      auto returns a JPEG for one portrait and a ZIP for several.
+    POST /reload    - reloads the models, e.g. after model.pt was replaced, without
+                      dropping requests
+    """
+    server_version = "ImageExtractor"
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send_json(200, self.server.service.status())
+        elif path == "/metrics":
+            self._send(200, self.server.service.metrics.to_prometheus().encode("utf-8"),
+                       "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"error": f"Unknown path '{path}'."})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path == "/reload":
+            try:
+                self.server.service.reload()
+            except Exception as e:
+                log_message(f"Error reloading the models: {e}", "error")
+                self._send_json(500, {"error": f"Reload failed: {e}"})
+                return
+            log_message("Models reloaded.")
+            self._send_json(200, self.server.service.status())
+            return
+        if url.path != "/extract":
+            self._send_json(404, {"error": f"Unknown path '{url.path}'."})
+            return
+
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            all_faces = query.get("all_faces", "0").lower() in ("1", "true", "yes")
+            response_format = query.get("format", "auto")
+            if response_format not in ("auto", "jpeg", "zip"):
+                raise ValueError("format must be auto, jpeg or zip.")
+            quality = int(query.get("quality", self.server.jpeg_quality))
+            if not 1 <= quality <= 100:
+                raise ValueError("quality must be between 1 and 100.")
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        if length <= 0:
+            self._send_json(400, {"error": "The request body must contain the file to process."})
+            return
+        if length > self.server.max_upload_bytes:
+            self._send_json(413, {"error": "The upload is too large."})
+            self.close_connection = True
+            return
+
+        data = self.rfile.read(length)
+        base_name = os.path.splitext(os.path.basename(query.get("filename", "upload")))[0]
+        # The name ends up in a response header, so control characters and quotes are dropped.
+        base_name = "".join(char for char in base_name if char.isprintable() and char != '"') or "upload"
+        try:
+            portraits = self.server.service.extract(data, all_faces)
+        except UnsupportedUpload as e:
+            self._send_json(415, {"error": str(e)})
+            return
+        except Exception as e:
+            log_message(f"Error processing request: {e}", "error")
+            self._send_json(500, {"error": f"Processing failed: {e}"})
+            return
+
+        if not portraits:
+            self._send_json(422, {"error": "No usable photo found in the uploaded file."})
+            return
+
+        headers = {"X-Portrait-Count": str(len(portraits))}
+        if response_format == "jpeg" or (response_format == "auto" and len(portraits) == 1):
+            file_name = build_portrait_filename(base_name, 0, 1)
+            headers["Content-Disposition"] = content_disposition(file_name)
+            self._send(200, encode_portrait(portraits[0], "jpeg", quality), "image/jpeg", headers)
+        else:
+            archive = io.BytesIO()
+            export_portraits(portraits, base_name, archive, "jpeg", quality, as_zip=True)
+            headers["Content-Disposition"] = content_disposition(f"{base_name}_img_extracted.zip")
+            self._send(200, archive.getvalue(), "application/zip", headers)
+
+    def log_message(self, format, *args):
+        log_message(f"{self.address_string()} - {format % args}")
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, jpeg_quality=95, max_upload_mb=50):
+    """
+    Binds the HTTP server for an ExtractionService without starting it. Each request
+    is handled on its own thread. Port 0 picks a free port (see server.server_address).
+    """
+    server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.jpeg_quality = jpeg_quality
+    server.max_upload_bytes = max_upload_mb * 1024 * 1024
+    return server
+
+def run_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, jpeg_quality=95, max_upload_mb=50):
+    """
+    Serves an ExtractionService over HTTP until interrupted. The model calls of
+    concurrent requests meet in the service's micro-batches.
+    """
+    server = make_server(service, host, port, jpeg_quality, max_upload_mb)
+
+    log_message(f"Serving on http://{host}:{server.server_address[1]} with {service.pool.size} model(s). "
+                f"Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log_message("Shutting down...")
+    finally:
+        server.server_close()
+        service.close()
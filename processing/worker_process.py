@@ -0,0 +1,26 @@
+from processing.image_processor import ImageProcessor
+from processing.processor_pool import configure_threads
+
+# Each worker process loads the model once and keeps it for every task it handles.
+processor = None
+# Metrics records of the current task, sent back to the parent with its result.
+records = []
+
+def init_worker(processor_kwargs, threads_per_worker):
+    """
+    Loads and warms up the ImageProcessor of a worker process. Shared by the pool
+    initializers of the batch command and the DocumentEngine.
+
+    Tasks read the model as `worker_process.processor`, call start_task() before
+    their work and send `list(worker_process.records)` back with their result.
+    """
+    global processor
+    # N workers share the cores instead of each trying to use all of them.
+    configure_threads(threads_per_worker)
+    processor = ImageProcessor(**processor_kwargs, intra_op_threads=threads_per_worker)
+    processor.add_metrics_hook(records.append)
+    processor.warm_up()
+
+def start_task():
+    """Drops the metrics records of the previous task."""
+    records.clear()
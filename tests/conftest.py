@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are imported the way main.py and cli.py import them, from the project folder.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
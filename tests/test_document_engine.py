@@ -0,0 +1,14 @@
+from processing.cancellation import CancellationToken
+from processing.document_engine import _RunCancelEvent
+
+def test_cancelling_one_run_does_not_cancel_another():
+    cancelled_runs = {}
+    first = CancellationToken(_RunCancelEvent(cancelled_runs, 1))
+    second = CancellationToken(_RunCancelEvent(cancelled_runs, 2))
+
+    first.cancel()
+
+    assert first.cancelled
+    assert not second.cancelled
+    cancelled_runs.pop(1)
+    assert not first.cancelled
@@ -0,0 +1,72 @@
+import io
+import zipfile
+import numpy as np
+from PIL import Image
+from utils.document_handler import iter_images_from_document
+from utils.image_prefilter import ImagePrefilter
+
+CONTENT_TYPES = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    b'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>'
+)
+DOCUMENT = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    b'<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body/></w:document>'
+)
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"/>'
+
+def _png(seed, size=(120, 160)):
+    # Noise, so that the prefilter does not take the image for a blank one or line art.
+    pixels = np.random.default_rng(seed).integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG")
+    return buffer.getvalue()
+
+def _write_docx(path, media):
+    """Writes a minimal DOCX package holding the given {name: bytes} files under word/media/."""
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("[Content_Types].xml", CONTENT_TYPES)
+        archive.writestr("word/document.xml", DOCUMENT)
+        for name, data in media.items():
+            archive.writestr("word/media/" + name, data)
+    return str(path)
+
+def test_unsupported_media_is_skipped_and_later_images_are_kept(tmp_path):
+    docx_path = _write_docx(tmp_path / "resume.docx", {
+        "image1.png": _png(1),
+        "image2.svg": SVG,
+        "image3.bin": b"not an image at all",
+        "image4.png": _png(4),
+    })
+
+    items = list(iter_images_from_document(docx_path))
+
+    # Skipped entries keep their number, so the indexes still refer to the media order.
+    assert [item.index for item in items] == [0, 3]
+    assert [item.image.size for item in items] == [(120, 160), (120, 160)]
+    assert all(item.total == 4 for item in items)
+
+def test_damaged_image_data_is_skipped_by_the_prefilter(tmp_path):
+    damaged = _png(2)[:200]
+    docx_path = _write_docx(tmp_path / "scan.docx", {
+        "image1.png": damaged,
+        "image2.png": _png(3),
+    })
+
+    items = list(iter_images_from_document(docx_path, prefilter=ImagePrefilter()))
+
+    assert [item.index for item in items] == [1]
+
+def test_identical_media_parts_are_analyzed_once(tmp_path):
+    logo = _png(5)
+    docx_path = _write_docx(tmp_path / "letter.docx", {
+        "image1.png": logo,
+        "image2.png": _png(6),
+        "image10.png": logo,
+    })
+
+    items = list(iter_images_from_document(docx_path))
+
+    assert len(items) == 2
+    assert items[0].locations == [(None, "media/image1.png"), (None, "media/image10.png")]
+    assert items[1].locations == [(None, "media/image2.png")]
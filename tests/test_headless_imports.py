@@ -0,0 +1,11 @@
+import os
+import subprocess
+import sys
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_headless_commands_import_without_tkinter():
+    # A None entry in sys.modules makes `import tkinter` fail, as on a Python build without Tk.
+    code = "import sys; sys.modules['tkinter'] = None; import cli, processing.batch, processing.server"
+    result = subprocess.run([sys.executable, "-c", code], cwd=PACKAGE_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
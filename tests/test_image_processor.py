@@ -0,0 +1,43 @@
+import pytest
+from processing.image_processor import ImageProcessor
+
+@pytest.fixture
+def processor():
+    # Only the geometry helpers are tested, so no model is loaded.
+    processor = ImageProcessor.__new__(ImageProcessor)
+    processor.multi_face_iou = 0.4
+    return processor
+
+def _face(box, confidence):
+    return (box, confidence, None, list(box), None)
+
+def test_distinct_faces_are_kept_in_reading_order(processor):
+    faces = [
+        _face((300, 400, 400, 520), 0.8),
+        _face((300, 50, 400, 170), 0.6),
+        _face((50, 50, 150, 170), 0.9),
+    ]
+    assert processor._suppress_duplicate_faces(faces) == [2, 1, 0]
+
+def test_overlapping_detections_of_one_face_are_merged(processor):
+    faces = [
+        _face((100, 100, 200, 220), 0.7),
+        _face((105, 102, 205, 225), 0.9),
+    ]
+    assert processor._suppress_duplicate_faces(faces) == [1]
+
+def test_a_box_nested_in_a_larger_one_is_dropped(processor):
+    # A tight candidate and the full page see the same face with a low IoU.
+    faces = [
+        _face((100, 100, 300, 340), 0.6),
+        _face((150, 150, 230, 240), 0.95),
+    ]
+    assert processor._suppress_duplicate_faces(faces) == [1]
+
+def test_no_faces(processor):
+    assert processor._suppress_duplicate_faces([]) == []
+
+def test_box_iou():
+    assert ImageProcessor._box_iou((0, 0, 10, 10), (0, 0, 10, 10)) == pytest.approx(1.0)
+    assert ImageProcessor._box_iou((0, 0, 10, 10), (5, 0, 15, 10)) == pytest.approx(1 / 3)
+    assert ImageProcessor._box_iou((0, 0, 10, 10), (20, 20, 30, 30)) == 0.0
@@ -0,0 +1,162 @@
+import threading
+import time
+import numpy as np
+import pytest
+from processing.inference_backends import _ExportedYoloBackend, MicroBatchingBackend, MODEL_STRIDE
+
+def _raw_output(predictions, classes=2):
+    """Builds a raw (4 + classes, anchors) YOLOv8 output from (cx, cy, w, h, class, score) rows."""
+    output = np.zeros((4 + classes, len(predictions)), dtype=np.float32)
+    for anchor, (cx, cy, w, h, class_id, score) in enumerate(predictions):
+        output[:4, anchor] = (cx, cy, w, h)
+        output[4 + class_id, anchor] = score
+    return output
+
+@pytest.fixture
+def backend():
+    return _ExportedYoloBackend()
+
+def test_overlapping_boxes_of_different_classes_are_merged(backend):
+    output = _raw_output([
+        (100, 100, 50, 60, 0, 0.9),
+        (102, 101, 50, 60, 1, 0.8),
+    ])
+    boxes = backend._decode(output, 0.25, 1.0, (0, 0), (640, 640))
+    assert len(boxes) == 1
+    assert boxes[0][4] == pytest.approx(0.9)
+
+def test_separate_faces_are_kept_most_confident_first(backend):
+    output = _raw_output([
+        (100, 100, 50, 60, 0, 0.5),
+        (400, 300, 50, 60, 0, 0.95),
+        (250, 500, 40, 40, 1, 0.7),
+    ])
+    boxes = backend._decode(output, 0.25, 1.0, (0, 0), (640, 640))
+    assert [round(box[4], 2) for box in boxes] == [0.95, 0.7, 0.5]
+
+def test_boxes_below_the_threshold_are_dropped(backend):
+    output = _raw_output([(100, 100, 50, 60, 0, 0.2), (300, 300, 50, 60, 1, 0.1)])
+    assert backend._decode(output, 0.25, 1.0, (0, 0), (640, 640)) == []
+
+def test_boxes_are_mapped_back_through_the_letterbox(backend):
+    output = _raw_output([(110, 120, 40, 60, 0, 0.9)])
+    x1, y1, x2, y2, _ = backend._decode(output, 0.25, 0.5, (10, 20), (1000, 1000))[0]
+    assert (x1, y1, x2, y2) == pytest.approx((160, 140, 240, 260))
+
+def test_boxes_are_clipped_to_the_image(backend):
+    output = _raw_output([(10, 10, 60, 60, 0, 0.9)])
+    x1, y1, x2, y2, _ = backend._decode(output, 0.25, 1.0, (0, 0), (30, 30))[0]
+    assert (x1, y1, x2, y2) == (0.0, 0.0, 30.0, 30.0)
+
+def test_letterbox_pads_to_a_square_input(backend):
+    from PIL import Image
+    tensor, ratio, pad, original_size = backend._letterbox(Image.new("RGB", (200, 100)), 320)
+    assert tensor.shape == (3, 320, 320)
+    assert ratio == pytest.approx(1.6)
+    assert pad == (0, 80)
+    assert original_size == (200, 100)
+
+@pytest.mark.parametrize("requested, expected", [(None, 640), (320, 320), (300, 320), (10, MODEL_STRIDE)])
+def test_input_size_is_rounded_up_to_the_stride(backend, requested, expected):
+    assert backend._input_size(requested) == expected
+
+def test_fixed_size_graphs_keep_their_input_size(backend):
+    backend.fixed_image_size = 640
+    assert backend._input_size(320) == 640
+
+def test_calibration_images_come_from_a_directory_or_a_dataset_yaml(tmp_path):
+    from processing.inference_backends import _calibration_image_paths
+    images = tmp_path / "datasets" / "scans" / "images" / "val"
+    images.mkdir(parents=True)
+    for name in ("b.jpg", "a.PNG", "notes.txt"):
+        (images / name).write_bytes(b"")
+    dataset = tmp_path / "scans.yaml"
+    dataset.write_text("path: datasets/scans\ntrain: images/train\nval: images/val\n")
+
+    expected = [str(images / "a.PNG"), str(images / "b.jpg")]
+    assert _calibration_image_paths(str(images)) == expected
+    assert _calibration_image_paths(str(dataset)) == expected
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    with pytest.raises(FileNotFoundError):
+        _calibration_image_paths(str(empty))
+
+class _RecordingBackend:
+    """Answers each image with its own name, conf and imgsz, and records every model call."""
+    name = "stub"
+
+    def __init__(self, fail_on_conf=None):
+        self.calls = []
+        self.fail_on_conf = fail_on_conf
+
+    def predict(self, images, conf, imgsz):
+        self.calls.append((list(images), conf, imgsz))
+        if conf == self.fail_on_conf:
+            raise RuntimeError("model failed")
+        return [[(image, conf, imgsz)] for image in images]
+
+def _predict_concurrently(batcher, calls):
+    """Runs the (images, conf, imgsz) calls from one thread each, all at once."""
+    from concurrent.futures import ThreadPoolExecutor
+    barrier = threading.Barrier(len(calls))
+
+    def call(args):
+        barrier.wait()
+        images, conf, imgsz = args
+        try:
+            return batcher.predict(images, conf, imgsz)
+        except RuntimeError as e:
+            return e
+
+    with ThreadPoolExecutor(len(calls)) as executor:
+        return list(executor.map(call, calls))
+
+def test_concurrent_calls_are_batched_and_split_by_conf_and_imgsz():
+    backend = _RecordingBackend()
+    # The batch runs as soon as all 7 images are in; the wait is only an upper bound.
+    batcher = MicroBatchingBackend(backend, max_batch_size=7, max_wait_ms=2000)
+    calls = [
+        (["a1", "a2"], 0.25, 640),
+        (["b1"], 0.25, 640),
+        (["c1"], 0.5, 640),
+        (["d1", "d2"], 0.25, 320),
+        (["e1"], 0.5, 640),
+    ]
+    try:
+        results = _predict_concurrently(batcher, calls)
+    finally:
+        batcher.close()
+
+    # Every caller gets the detections of its own images, in order.
+    for (images, conf, imgsz), detections in zip(calls, results):
+        assert detections == [[(image, conf, imgsz)] for image in images]
+    # One model call per (conf, imgsz) group, holding the images of all its callers.
+    groups = {(conf, imgsz): sorted(images) for images, conf, imgsz in backend.calls}
+    assert len(backend.calls) == len(groups) == 3
+    assert groups == {
+        (0.25, 640): ["a1", "a2", "b1"],
+        (0.5, 640): ["c1", "e1"],
+        (0.25, 320): ["d1", "d2"],
+    }
+    assert (batcher.batches, batcher.batched_images) == (3, 7)
+
+def test_a_failing_group_only_fails_its_own_callers():
+    backend = _RecordingBackend(fail_on_conf=0.5)
+    batcher = MicroBatchingBackend(backend, max_batch_size=2, max_wait_ms=2000)
+    try:
+        ok, failed = _predict_concurrently(batcher, [(["a"], 0.25, None), (["b"], 0.5, None)])
+    finally:
+        batcher.close()
+
+    assert ok == [[("a", 0.25, None)]]
+    assert isinstance(failed, RuntimeError)
+
+def test_a_full_batch_runs_without_waiting():
+    backend = _RecordingBackend()
+    batcher = MicroBatchingBackend(backend, max_batch_size=2, max_wait_ms=10_000)
+    try:
+        started_at = time.perf_counter()
+        assert batcher.predict(["a", "b"], 0.25) == [[("a", 0.25, None)], [("b", 0.25, None)]]
+        assert time.perf_counter() - started_at < 5
+    finally:
+        batcher.close()
@@ -0,0 +1,87 @@
+import threading
+import time
+import pytest
+from processing.cancellation import CancellationToken, OperationCancelled
+from processing.pipeline import StagedPipeline
+
+def _pipeline_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith("pipeline-")]
+
+def _slow(value):
+    time.sleep(0.05)
+    return value
+
+def test_results_keep_input_order_with_several_workers():
+    def jitter(value):
+        time.sleep(0.01 * (value % 3))
+        return value * 2
+
+    pipeline = StagedPipeline([("double", jitter, 3), ("slow", _slow, 2)], queue_size=2)
+    assert list(pipeline.run(range(12))) == [value * 2 for value in range(12)]
+    assert not _pipeline_threads()
+
+def test_stage_error_is_raised_in_order_and_all_threads_are_joined():
+    in_stage = threading.Event()
+
+    def fail_on_three(value):
+        if value == 3:
+            raise ValueError("bad item")
+        return value
+
+    def busy(value):
+        in_stage.set()
+        time.sleep(0.1)
+        return value
+
+    pipeline = StagedPipeline([("check", fail_on_three, 1), ("busy", busy, 2)], queue_size=2)
+    results = []
+    with pytest.raises(ValueError, match="bad item"):
+        for value in pipeline.run(range(20)):
+            results.append(value)
+
+    assert results == [0, 1, 2]
+    assert in_stage.is_set()
+    # run() only gives control back once no stage is still working on an item.
+    assert not _pipeline_threads()
+
+def test_failing_source_surfaces_after_the_items_before_it():
+    def items():
+        yield 1
+        yield 2
+        raise RuntimeError("source broke")
+
+    pipeline = StagedPipeline([("slow", _slow, 1)])
+    results = []
+    with pytest.raises(RuntimeError, match="source broke"):
+        for value in pipeline.run(items()):
+            results.append(value)
+    assert results == [1, 2]
+    assert not _pipeline_threads()
+
+def test_cancellation_stops_the_run_and_joins_all_threads():
+    token = CancellationToken()
+    calls = []
+
+    def cancellable(value):
+        token.raise_if_cancelled()
+        calls.append(value)
+        time.sleep(0.02)
+        return value
+
+    pipeline = StagedPipeline([("work", cancellable, 2), ("slow", _slow, 1)], queue_size=2)
+    started_at = time.perf_counter()
+    with pytest.raises(OperationCancelled):
+        for value in pipeline.run(range(1000)):
+            if value == 2:
+                token.cancel()
+
+    assert time.perf_counter() - started_at < 5
+    assert len(calls) < 1000
+    assert not _pipeline_threads()
+
+def test_closing_the_generator_early_joins_all_threads():
+    pipeline = StagedPipeline([("slow", _slow, 2), ("slow2", _slow, 2)], queue_size=2)
+    results = pipeline.run(range(100))
+    assert next(results) == 0
+    results.close()
+    assert not _pipeline_threads()
@@ -0,0 +1,86 @@
+import threading
+import time
+import pytest
+from processing import processor_pool
+from processing.processor_pool import ProcessorPool
+
+class StubBackend:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class StubProcessor:
+    """Stands in for ImageProcessor: has a backend to close, but loads no model."""
+    def __init__(self, generation=0, **kwargs):
+        self.generation = generation
+        self.backend = StubBackend()
+
+    def warm_up(self):
+        return 0.0
+
+@pytest.fixture(autouse=True)
+def stub_processor(monkeypatch):
+    monkeypatch.setattr(processor_pool, "ImageProcessor", StubProcessor)
+    monkeypatch.setattr(processor_pool, "configure_threads", lambda threads: None)
+
+def _in_thread(target):
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+def test_jobs_go_to_the_least_busy_processor_and_wait_for_a_free_slot():
+    pool = ProcessorPool(size=2, jobs_per_processor=2)
+    first, second = pool.processors
+
+    with pool.checkout() as a, pool.checkout() as b, pool.checkout() as c, pool.checkout() as d:
+        assert sorted(map(id, (a, b, c, d))) == sorted(map(id, (first, first, second, second)))
+        assert a is not b
+
+        got = []
+
+        def take():
+            with pool.checkout() as processor:
+                got.append(processor)
+
+        waiting = _in_thread(take)
+        time.sleep(0.1)
+        assert waiting.is_alive() and not got
+    waiting.join(timeout=5)
+    assert got and got[0] in (first, second)
+
+def test_reload_waits_for_a_checked_out_job_and_new_jobs_get_the_new_processors():
+    pool = ProcessorPool({"generation": 1})
+    old = pool.processors[0]
+
+    with pool.checkout() as running:
+        assert running is old
+        reload = _in_thread(lambda: pool.reload({"generation": 2}))
+        deadline = time.time() + 5
+        while pool.processors[0] is old and time.time() < deadline:
+            time.sleep(0.01)
+
+        # The swap happened, but the reload is still waiting for the running job.
+        new = pool.processors[0]
+        assert new.generation == 2
+        time.sleep(0.1)
+        assert reload.is_alive()
+        assert not old.backend.closed
+
+        # A new job does not wait for the drain, and gets the new processor.
+        with pool.checkout() as job:
+            assert job is new
+
+    reload.join(timeout=5)
+    assert not reload.is_alive()
+    assert old.backend.closed
+    assert not new.backend.closed
+
+def test_close_refuses_new_jobs():
+    pool = ProcessorPool()
+    pool.close()
+    assert pool.processors[0].backend.closed
+    with pytest.raises(RuntimeError):
+        with pool.checkout():
+            pass
@@ -0,0 +1,81 @@
+import io
+import os
+import time
+from PIL import Image
+from processing.result_cache import ResultCache
+
+def _stored_bytes(cache):
+    return sum(size for _, size, _ in cache._scan_entries())
+
+def _portrait(color="red", size=64):
+    return Image.new("RGB", (size, size), color)
+
+def _portrait_bytes():
+    buffer = io.BytesIO()
+    _portrait().save(buffer, "PNG")
+    return buffer.getvalue()
+
+def test_hit_and_miss(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = ResultCache.make_key("content", "settings")
+
+    assert cache.get(key) == (False, None)
+    cache.put(key, _portrait())
+    hit, portrait = cache.get(key)
+    assert hit and portrait.size == (64, 64)
+
+def test_no_face_verdict_is_cached(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = ResultCache.make_key("blank page")
+    cache.put(key, None)
+    assert cache.get(key) == (True, None)
+
+def test_overwrite_counts_the_entry_once(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = ResultCache.make_key("same input")
+    for _ in range(5):
+        cache.put(key, _portrait())
+    assert cache._total_bytes == _stored_bytes(cache)
+
+def test_new_verdict_replaces_the_other_suffix(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = ResultCache.make_key("re-processed input")
+    cache.put(key, _portrait())
+    cache.put(key, None)
+
+    assert cache.get(key) == (True, None)
+    assert cache._total_bytes == _stored_bytes(cache)
+    assert len(cache._scan_entries()) == 1
+
+def test_eviction_removes_least_recently_used_entries(tmp_path):
+    entry_size = len(_portrait_bytes())
+    cache = ResultCache(str(tmp_path), max_bytes=entry_size * 4)
+    keys = [ResultCache.make_key(i) for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.put(key, _portrait())
+        # Modification times drive the LRU order; make it independent of the clock resolution.
+        stamp = time.time() - 100 + i
+        os.utime(cache._entry_path(key, ResultCache.PORTRAIT_SUFFIX), (stamp, stamp))
+
+    # A hit refreshes the oldest entry, so the second one becomes the least recently used.
+    assert cache.get(keys[0])[0]
+    cache.put(ResultCache.make_key("one more"), _portrait())
+
+    assert cache._total_bytes <= cache.max_bytes * 0.9
+    assert cache._total_bytes == _stored_bytes(cache)
+    assert cache.get(keys[0])[0]
+    assert not cache.get(keys[1])[0]
+
+def test_orphaned_temp_files_are_removed_on_open(tmp_path):
+    shard = tmp_path / "ab"
+    shard.mkdir()
+    orphan, in_progress = shard / "orphan.tmp", shard / "in_progress.tmp"
+    orphan.write_bytes(b"partial")
+    in_progress.write_bytes(b"partial")
+    old = time.time() - ResultCache.ORPHAN_TEMP_AGE_SECONDS - 10
+    os.utime(orphan, (old, old))
+
+    ResultCache(str(tmp_path))
+
+    assert not orphan.exists()
+    assert in_progress.exists()
@@ -0,0 +1,146 @@
+import io
+import json
+import threading
+import zipfile
+from http.client import HTTPConnection
+import pytest
+from PIL import Image
+from processing.metrics import MetricsRegistry
+from processing.server import make_server, sniff_extension
+
+class FakeService:
+    """Stands in for ExtractionService: sniffs the upload like it does, but runs no model."""
+    def __init__(self):
+        self.metrics = MetricsRegistry()
+        self.portraits = []
+        self.uploads = []
+
+    def extract(self, data, all_faces=False):
+        self.uploads.append((sniff_extension(data), all_faces))
+        return list(self.portraits)
+
+    def status(self):
+        return {"status": "ok"}
+
+    def reload(self):
+        pass
+
+    def close(self):
+        pass
+
+def _jpeg(color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (80, 100), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+def _zip(names):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name in names:
+            archive.writestr(name, b"<xml/>")
+    return buffer.getvalue()
+
+@pytest.fixture
+def service():
+    return FakeService()
+
+@pytest.fixture
+def request_server(service):
+    server = make_server(service, "127.0.0.1", 0)
+    # Small, so the rejected body of the 413 test fits in the socket buffers.
+    server.max_upload_bytes = 64 * 1024
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+
+    def send(method, path, body=None):
+        connection = HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+        try:
+            connection.request(method, path, body=body)
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            connection.close()
+
+    yield send
+    server.shutdown()
+    server.server_close()
+
+def test_single_portrait_is_returned_as_jpeg(request_server, service):
+    service.portraits = [Image.new("RGB", (50, 50), "blue")]
+    status, headers, body = request_server("POST", "/extract?filename=scan.jpg", _jpeg())
+
+    assert status == 200
+    assert headers["Content-Type"] == "image/jpeg"
+    assert headers["X-Portrait-Count"] == "1"
+    assert 'filename="scan_img_extracted.jpg"' in headers["Content-Disposition"]
+    assert Image.open(io.BytesIO(body)).size == (50, 50)
+    assert service.uploads == [(".jpg", False)]
+
+def test_several_portraits_are_returned_as_zip(request_server, service):
+    service.portraits = [Image.new("RGB", (50, 50), color) for color in ("red", "green")]
+    status, headers, body = request_server("POST", "/extract?all_faces=1&filename=sheet.png", _jpeg())
+
+    assert status == 200
+    assert headers["Content-Type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(body)) as archive:
+        assert archive.namelist() == ["sheet_img_extracted1.jpg", "sheet_img_extracted2.jpg"]
+    assert service.uploads == [(".jpg", True)]
+
+def test_upload_without_a_portrait_gets_422(request_server):
+    status, _, body = request_server("POST", "/extract", _jpeg())
+    assert status == 422
+    assert "error" in json.loads(body)
+
+@pytest.mark.parametrize("body", [
+    b"plain text, not an image",
+    _zip(["notes.txt"]),
+    b"PK\x03\x04 damaged archive",
+])
+def test_unsupported_upload_gets_415(request_server, body):
+    status, _, _ = request_server("POST", "/extract", body)
+    assert status == 415
+
+def test_docx_package_is_accepted(request_server, service):
+    service.portraits = [Image.new("RGB", (50, 50))]
+    status, _, _ = request_server("POST", "/extract", _zip(["[Content_Types].xml", "word/document.xml"]))
+    assert status == 200
+    assert service.uploads == [(".docx", False)]
+
+@pytest.mark.parametrize("query", ["format=gif", "quality=0", "quality=abc"])
+def test_invalid_parameters_get_400(request_server, query):
+    status, _, _ = request_server("POST", "/extract?" + query, _jpeg())
+    assert status == 400
+
+def test_empty_body_gets_400(request_server):
+    status, _, _ = request_server("POST", "/extract", b"")
+    assert status == 400
+
+def test_oversized_upload_gets_413(request_server):
+    status, _, _ = request_server("POST", "/extract", b"\0" * (64 * 1024 + 1))
+    assert status == 413
+
+def test_health_metrics_and_unknown_paths(request_server):
+    status, _, body = request_server("GET", "/health")
+    assert status == 200 and json.loads(body) == {"status": "ok"}
+    status, headers, _ = request_server("GET", "/metrics")
+    assert status == 200 and headers["Content-Type"].startswith("text/plain")
+    assert request_server("GET", "/nowhere")[0] == 404
+    assert request_server("POST", "/nowhere", b"x")[0] == 404
+
+def test_non_ascii_filename_gets_an_ascii_fallback_and_a_utf8_name(request_server, service):
+    service.portraits = [Image.new("RGB", (50, 50))]
+    status, headers, _ = request_server("POST", "/extract?filename=%E7%AE%80%E5%8E%86.jpg", _jpeg())
+
+    assert status == 200
+    disposition = headers["Content-Disposition"]
+    assert 'filename="___img_extracted.jpg"' in disposition
+    assert "filename*=UTF-8''%E7%AE%80%E5%8E%86_img_extracted.jpg" in disposition
+
+def test_line_breaks_in_the_filename_cannot_inject_headers(request_server, service):
+    service.portraits = [Image.new("RGB", (50, 50))]
+    status, headers, _ = request_server(
+        "POST", "/extract?filename=a%0d%0aX-Injected:%20yes%0d%0a%22.jpg", _jpeg())
+
+    assert status == 200
+    assert "X-Injected" not in headers
+    assert 'filename="aX-Injected: yes_img_extracted.jpg"' in headers["Content-Disposition"]
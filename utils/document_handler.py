@@ -1,60 +1,365 @@
 import fitz  # PyMuPDF
-from docx import Document
-from PIL import Image
+from PIL import Image, ImageFile
 import io
-from pdf2image import convert_from_path
 import os
+import re
+import hashlib
+import posixpath
+import zipfile
+from xml.etree import ElementTree
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from utils.image_prefilter import EMU_PER_POINT
+from utils.logging_config import log_message
 
-def extract_images_from_document(file_path):
+# Resolution used when PDF pages have to be rendered because they carry no embedded images.
+DEFAULT_RENDER_DPI = 200
+
+# Every image of a DOCX package, whether used in the body, a header, a footer or a
+# note, is stored as a part under this folder of the ZIP.
+DOCX_MEDIA_PREFIX = "word/media/"
+
+class DocumentImage:
     """
-    Extracts PIL Image objects from a given document file (PDF or DOCX).
+    An image found in a document, together with where it was found.
+
+    Attributes:
+        image (PIL.Image.Image): The image itself.
+        index (int): Zero-based position of the image in the document.
+        page_number (int): One-based page number of the first occurrence, or None
+                           for DOCX files.
+        xref (int): PDF cross-reference number of an embedded image, or None
+                    for rendered pages and DOCX images.
+        locations (list): Every place the image appears, as (page_number, reference)
+                          pairs. The reference is the xref for PDF images and the
+                          media part name for DOCX images.
+        total (int): Number of images in the document, skipped ones included, so
+                     (index + 1) / total is the share of the document done. None
+                     when unknown.
+    """
+    def __init__(self, image, index, page_number=None, xref=None, locations=None, total=None):
+        self.image = image
+        self.index = index
+        self.total = total
+        self.page_number = page_number
+        self.xref = xref
+        self.locations = locations if locations is not None else [(page_number, xref)]
+
+def _pixmap_to_pil(pix):
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+def _render_page_in_worker(file_path, page_index, dpi):
+    """
+    Renders one page in a separate process. Each call opens its own document,
+    as PyMuPDF objects cannot be shared between processes.
+    """
+    doc = fitz.open(file_path)
+    try:
+        pix = doc.load_page(page_index).get_pixmap(dpi=dpi, alpha=False)
+        return pix.width, pix.height, pix.samples
+    finally:
+        doc.close()
+
+def iter_rendered_pages(file_path, page_count, dpi=DEFAULT_RENDER_DPI, workers=1):
+    """
+    Renders the pages of a PDF on demand with PyMuPDF, in page order.
 
     Args:
-        file_path (str): The path to the document.
+        file_path (str): The path to the PDF.
+        page_count (int): Number of pages to render.
+        dpi (int): Rendering resolution. Lower values are faster and are often
+                   enough to locate a photo on the page.
+        workers (int): Number of processes rendering pages in parallel. With
+                       1, pages are rendered in the calling process.
+
+    Yields:
+        PIL.Image.Image: One RGB image per page.
+    """
+    if workers <= 1 or page_count <= 1:
+        doc = fitz.open(file_path)
+        try:
+            for page_index in range(page_count):
+                yield _pixmap_to_pil(doc.load_page(page_index).get_pixmap(dpi=dpi, alpha=False))
+        finally:
+            doc.close()
+        return
+
+    # At most two pages per worker are rendered ahead of the consumer.
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = deque()
+        for page_index in range(page_count):
+            pending.append(executor.submit(_render_page_in_worker, file_path, page_index, dpi))
+            if len(pending) >= 2 * workers:
+                width, height, samples = pending.popleft().result()
+                yield Image.frombytes("RGB", (width, height), samples)
+        while pending:
+            width, height, samples = pending.popleft().result()
+            yield Image.frombytes("RGB", (width, height), samples)
+    finally:
+        # A consumer that stops early (e.g. a cancelled run) does not wait for pages it will not use.
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _group_pdf_images(doc, with_display_sizes=False):
+    """
+    Finds every embedded image of a PDF without decoding any of them, and groups
+    the occurrences that share an xref or identical raw image data.
+
+    Args:
+        doc (fitz.Document): The open PDF.
+        with_display_sizes (bool): Also measure the largest rectangle each image
+                                   is drawn in on its pages.
 
     Returns:
-        list: A list of PIL Image objects found in the document.
-              Returns an empty list if no images are found or the file type is unsupported.
+        list: One (first_xref, locations, pixel_size, display_size) tuple per unique
+              image, in order of first appearance. locations is a list of
+              (page_number, xref) pairs, pixel_size the stored (width, height) and
+              display_size the largest drawn (width, height) in points, or None.
+    """
+    groups = {}
+    group_by_xref = {}
+    for page_index, page in enumerate(doc):
+        for img in page.get_images(full=True):
+            xref = img[0]
+            group_key = group_by_xref.get(xref)
+            if group_key is None:
+                # Width, height, bits per component and colorspace, plus the still-compressed stream.
+                digest = hashlib.sha256(repr(img[2:6]).encode())
+                digest.update(doc.xref_stream_raw(xref) or b"")
+                group_key = digest.hexdigest()
+                group_by_xref[xref] = group_key
+                groups.setdefault(group_key, [xref, [], (img[2], img[3]), None])
+            group = groups[group_key]
+            group[1].append((page_index + 1, xref))
+
+            if with_display_sizes:
+                for rect in page.get_image_rects(xref):
+                    if group[3] is None or rect.width * rect.height > group[3][0] * group[3][1]:
+                        group[3] = (rect.width, rect.height)
+    return [tuple(group) for group in groups.values()]
+
+def _natural_key(name):
+    # image2.png sorts before image10.png.
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+def _group_docx_media(archive):
+    """
+    Lists the image parts of a DOCX package from the ZIP central directory, without
+    reading any of them, and groups identical ones by their CRC-32 and size.
+
+    Args:
+        archive (zipfile.ZipFile): The open DOCX package.
+
+    Returns:
+        list: One (member_name, locations) tuple per unique image, in media name
+              order. locations is a list of (None, part_name) pairs, part_name
+              being relative to word/, e.g. 'media/image1.png'.
+    """
+    groups = {}
+    for info in sorted(archive.infolist(), key=lambda info: _natural_key(info.filename)):
+        if info.is_dir() or not info.filename.startswith(DOCX_MEDIA_PREFIX):
+            continue
+        group = groups.setdefault((info.CRC, info.file_size), [info.filename, []])
+        group[1].append((None, info.filename[len("word/"):]))
+    return [tuple(group) for group in groups.values()]
+
+# The root element's start tag, which declares the namespace prefixes of a DOCX part.
+_ROOT_TAG_PATTERN = re.compile(rb"<([\w.-]+:[\w.-]+)(?:\s[^>]*)?>")
+_DRAWING_NS = "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
+
+def _docx_drawings(part_bytes):
+    """
+    Returns the inline and floating drawing elements of a DOCX part. Only the
+    drawing fragments are parsed: they are found with a byte search for the prefix
+    the root element declares for the drawing namespace, and parsed together under
+    a copy of the root's start tag. Parts that do not fit that shape (e.g. a
+    floating drawing nested in a text box) are parsed in full instead.
+    """
+    drawing_tags = ("{%s}inline" % _DRAWING_NS, "{%s}anchor" % _DRAWING_NS)
+    root = _ROOT_TAG_PATTERN.search(part_bytes)
+    if root:
+        declaration = re.search(rb'xmlns:([\w.-]+)="' + re.escape(_DRAWING_NS.encode()) + rb'"', root.group(0))
+        if declaration:
+            prefix = re.escape(declaration.group(1))
+            pattern = re.compile(rb"<" + prefix + rb":(inline|anchor)\b.*?</" + prefix + rb":\1>", re.S)
+            fragments = b"".join(match.group(0) for match in pattern.finditer(part_bytes))
+            try:
+                wrapper = ElementTree.fromstring(root.group(0) + fragments + b"</" + root.group(1) + b">")
+                return [element for element in wrapper if element.tag in drawing_tags]
+            except ElementTree.ParseError:
+                pass
+    return [element for element in ElementTree.fromstring(part_bytes).iter() if element.tag in drawing_tags]
+
+def _docx_display_sizes(archive):
+    """
+    Returns the largest size, in points, each image part of a DOCX package is drawn
+    at (inline or floating) in the body, headers, footers or notes, keyed by ZIP
+    member name. Only the parts whose relationships include an image are read.
+    """
+    relationship_tag = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+    extent_tag = "{%s}extent" % _DRAWING_NS
+    blip_tag = "{http://schemas.openxmlformats.org/drawingml/2006/main}blip"
+    embed_attr = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed"
+
+    member_names = set(archive.namelist())
+    sizes = {}
+    for rels_name in member_names:
+        if not (rels_name.startswith("word/_rels/") and rels_name.endswith(".rels")):
+            continue
+        part_name = "word/" + rels_name[len("word/_rels/"):-len(".rels")]
+        if part_name not in member_names:
+            continue
+
+        # Relationship id -> ZIP member name of each image the part refers to.
+        targets = {}
+        for relationship in ElementTree.fromstring(archive.read(rels_name)).iter(relationship_tag):
+            target = relationship.get("Target", "")
+            if relationship.get("TargetMode") == "External" or not relationship.get("Type", "").endswith("/image"):
+                continue
+            if target.startswith("/"):
+                targets[relationship.get("Id")] = target.lstrip("/")
+            else:
+                targets[relationship.get("Id")] = posixpath.normpath(posixpath.join("word", target))
+        if not targets:
+            continue
+
+        for drawing in _docx_drawings(archive.read(part_name)):
+            extent = drawing.find(extent_tag)
+            if extent is None:
+                continue
+            size = (int(extent.get("cx", 0)) / EMU_PER_POINT, int(extent.get("cy", 0)) / EMU_PER_POINT)
+            for blip in drawing.iter(blip_tag):
+                member_name = targets.get(blip.get(embed_attr))
+                if member_name and (member_name not in sizes or
+                                    size[0] * size[1] > sizes[member_name][0] * sizes[member_name][1]):
+                    sizes[member_name] = size
+    return sizes
+
+def _log_skipped(index, reason, page_number=None):
+    where = f" on page {page_number}" if page_number else ""
+    log_message(f"Skipping image #{index + 1}{where}: {reason}.")
+
+def iter_images_from_document(file_path, render_dpi=DEFAULT_RENDER_DPI, render_workers=1, prefilter=None):
+    """
+    Lazily yields the images of a document (PDF or DOCX) one at a time, so that
+    only the image currently being consumed has to be held in memory.
+
+    Images reused across the document (the same PDF xref, or identical image
+    data) are decoded and yielded only once, with every occurrence listed in
+    DocumentImage.locations.
+
+    With a prefilter, images that cannot contain a portrait are skipped, and the
+    reason is logged: by their stored and displayed size before they are decoded,
+    then by cheap pixel statistics. Skipped images keep their index, so the
+    numbering of the remaining ones still matches the document.
+
+    Args:
+        file_path (str): The path to the document.
+        render_dpi (int): Resolution used when PDF pages have to be rendered.
+        render_workers (int): Number of processes used to render PDF pages.
+        prefilter (ImagePrefilter): Optional filter for implausible images.
+
+    Yields:
+        DocumentImage: Each image found in the document, in document order.
+                       Nothing is yielded if the file type is unsupported. If an
+                       error occurs, it is reported and iteration stops.
     """
-    images = []
     file_extension = os.path.splitext(file_path)[1].lower()
 
     if file_extension == '.pdf':
+        index = 0
         try:
             # First, try to extract embedded images directly (more efficient)
             doc = fitz.open(file_path)
-            if doc.page_count > 0:
-                for page in doc:
-                    image_list = page.get_images(full=True)
-                    for img_index, img in enumerate(image_list):
-                        xref = img[0]
-                        base_image = doc.extract_image(xref)
-                        image_bytes = base_image["image"]
-                        pil_image = Image.open(io.BytesIO(image_bytes))
-                        images.append(pil_image)
-            doc.close()
+            try:
+                page_count = doc.page_count
+                groups = _group_pdf_images(doc, prefilter is not None)
+                for xref, locations, pixel_size, display_size in groups:
+                    page_number = locations[0][0]
+                    if prefilter is not None:
+                        reason = prefilter.check_metadata(*pixel_size, display_size)
+                        if reason:
+                            _log_skipped(index, reason, page_number)
+                            index += 1
+                            continue
+
+                    base_image = doc.extract_image(xref)
+                    image_bytes = base_image["image"]
+                    pil_image = Image.open(io.BytesIO(image_bytes))
+                    if prefilter is not None:
+                        reason = prefilter.check_pixels(pil_image)
+                        if reason:
+                            _log_skipped(index, reason, page_number)
+                            index += 1
+                            continue
+
+                    yield DocumentImage(pil_image, index, page_number=page_number, xref=xref,
+                                        locations=locations, total=len(groups))
+                    index += 1
+            finally:
+                doc.close()
 
             # If no embedded images were found, render pages as images (robust fallback)
-            if not images:
-                print("No embedded images found in PDF, falling back to page rendering...")
-                # You may need to provide the poppler path for Windows
-                # images = convert_from_path(file_path, poppler_path=r"C:\path\to\poppler\bin")
-                images = convert_from_path(file_path)
+            if index == 0:
+                print(f"No embedded images found in PDF, falling back to page rendering at {render_dpi} DPI...")
+                pages = iter_rendered_pages(file_path, page_count, dpi=render_dpi, workers=render_workers)
+                for page_index, pil_image in enumerate(pages):
+                    if prefilter is not None:
+                        reason = prefilter.check_pixels(pil_image, is_page=True)
+                        if reason:
+                            _log_skipped(page_index, reason, page_index + 1)
+                            continue
+                    yield DocumentImage(pil_image, page_index, page_number=page_index + 1, total=page_count)
 
         except Exception as e:
             print(f"Error processing PDF file '{os.path.basename(file_path)}': {e}")
-            return []
+            return
 
     elif file_extension == '.docx':
         try:
-            doc = Document(file_path)
-            for rel in doc.part.rels.values():
-                if "image" in rel.target_ref:
-                    image_bytes = rel.target_part.blob
-                    pil_image = Image.open(io.BytesIO(image_bytes))
-                    images.append(pil_image)
+            # The package is read as a plain ZIP: the image parts are found in the central
+            # directory, and each one is read only when its turn comes.
+            with zipfile.ZipFile(file_path) as archive:
+                groups = _group_docx_media(archive)
+                display_sizes = _docx_display_sizes(archive) if prefilter is not None else {}
+
+                for index, (member_name, locations) in enumerate(groups):
+                    try:
+                        # Opening only parses the header; pixels are decoded on first access.
+                        pil_image = Image.open(io.BytesIO(archive.read(member_name)))
+                    except OSError as e:
+                        # E.g. SVG or another format PIL cannot read; the other images still count.
+                        _log_skipped(index, f"'{posixpath.basename(member_name)}' is not a readable image ({e})")
+                        continue
+                    if isinstance(pil_image, ImageFile.StubImageFile):
+                        _log_skipped(index, f"vector image ({pil_image.format}) cannot be analyzed")
+                        continue
+                    if prefilter is not None:
+                        sizes = [display_sizes[name] for name in ("word/" + ref for _, ref in locations)
+                                 if name in display_sizes]
+                        display_size = max(sizes, key=lambda size: size[0] * size[1]) if sizes else None
+                        try:
+                            reason = (prefilter.check_metadata(*pil_image.size, display_size)
+                                      or prefilter.check_pixels(pil_image))
+                        except OSError as e:
+                            reason = f"the image data is damaged ({e})"
+                        if reason:
+                            _log_skipped(index, reason)
+                            continue
+                    yield DocumentImage(pil_image, index, locations=locations, total=len(groups))
         except Exception as e:
             print(f"Error processing DOCX file '{os.path.basename(file_path)}': {e}")
-            return []
+            return
 
-    return images
\ No newline at end of file
+def extract_images_from_document(file_path):
+    """
+    Extracts PIL Image objects from a given document file (PDF or DOCX).
+
+    Args:
+        file_path (str): The path to the document.
+
+    Returns:
+        list: A list of PIL Image objects found in the document.
+              Returns an empty list if no images are found or the file type is unsupported.
+    """
+    return [item.image for item in iter_images_from_document(file_path)]
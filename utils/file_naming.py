@@ -0,0 +1,19 @@
+def build_portrait_filename(base_name, index, total, extension=".jpg"):
+    """
+    Builds the file name for an extracted portrait, following the
+    `<source>_img_extracted[N]` convention used by the GUI.
+
+    Args:
+        base_name (str): The source file name without its extension.
+        index (int): Zero-based position of the portrait in the result set.
+        total (int): Number of portraits extracted from the source file.
+        extension (str): File extension, including the leading dot.
+
+    Returns:
+        str: The file name, e.g. 'resume_img_extracted2.jpg'.
+    """
+    if total > 1:
+        suffix = f"_img_extracted{index + 1}"
+    else:
+        suffix = "_img_extracted"
+    return f"{base_name}{suffix}{extension}"
@@ -0,0 +1,5 @@
+# File extensions understood by the extractor. Kept free of heavy imports so the
+# GUI and CLI can check file types before the document libraries are loaded.
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+DOCUMENT_EXTENSIONS = ('.pdf', '.docx')
+SUPPORTED_EXTENSIONS = IMAGE_EXTENSIONS + DOCUMENT_EXTENSIONS
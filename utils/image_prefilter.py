@@ -0,0 +1,86 @@
+import numpy as np
+
+# DOCX drawing extents are given in EMU; there are 12700 EMU per point.
+EMU_PER_POINT = 12700
+
+class ImagePrefilter:
+    """
+    Cheap checks that reject document images which cannot contain a usable
+    portrait (logos, icons, signatures, separators, blank pages) before they
+    are sent to the model.
+
+    check_metadata() works on sizes known before decoding: the pixel size of
+    the stored image and, when available, the size it is displayed at on the
+    page in points. check_pixels() works on a small grayscale thumbnail of the
+    decoded image. Both return a human-readable reason when the image should
+    be skipped, and None otherwise.
+
+    Args:
+        min_pixel_side (int): Smallest accepted width or height, in pixels.
+        min_display_side_pt (float): Smallest accepted displayed width or height,
+                                     in points (1/72 inch). 28pt is about 1cm.
+        max_aspect_ratio (float): Longest side over shortest side above which an
+                                  image is treated as a rule or a banner.
+        min_stddev (float): Grayscale standard deviation below which an image is
+                            treated as blank or flat.
+        max_gray_levels (int): Images whose pixels fall into at most this many of
+                               16 gray levels are treated as line art or text.
+    """
+    THUMBNAIL_SIDE = 128
+
+    def __init__(self, min_pixel_side=40, min_display_side_pt=28, max_aspect_ratio=4.0,
+                 min_stddev=6.0, max_gray_levels=2):
+        self.min_pixel_side = min_pixel_side
+        self.min_display_side_pt = min_display_side_pt
+        self.max_aspect_ratio = max_aspect_ratio
+        self.min_stddev = min_stddev
+        self.max_gray_levels = max_gray_levels
+
+    def check_metadata(self, width, height, display_size=None):
+        """
+        Args:
+            width (int): Stored image width in pixels.
+            height (int): Stored image height in pixels.
+            display_size (tuple): (width, height) on the page in points, or None
+                                  when unknown.
+        """
+        if min(width, height) < self.min_pixel_side:
+            return f"too small ({width}x{height} px)"
+        if max(width, height) / max(1, min(width, height)) > self.max_aspect_ratio:
+            return f"aspect ratio too extreme ({width}x{height} px)"
+        if display_size is not None:
+            display_w, display_h = display_size
+            if min(display_w, display_h) < self.min_display_side_pt:
+                return f"displayed too small ({display_w:.0f}x{display_h:.0f} pt)"
+        return None
+
+    def check_pixels(self, pil_image, is_page=False):
+        """
+        Args:
+            pil_image (PIL.Image.Image): The decoded image.
+            is_page (bool): The image is a rendered page. Only blank pages are
+                            rejected, as a page is mostly text by nature.
+        """
+        if not is_page:
+            reason = self.check_metadata(*pil_image.size)
+            if reason:
+                return reason
+
+        thumbnail = pil_image if pil_image.mode in ("L", "RGB") else pil_image.convert("RGB")
+        factor = max(1, max(thumbnail.size) // self.THUMBNAIL_SIDE)
+        if factor > 1:
+            thumbnail = thumbnail.reduce(factor)
+        gray = np.asarray(thumbnail.convert("L"), dtype=np.float32)
+
+        stddev = float(gray.std())
+        if stddev < self.min_stddev:
+            return f"nearly uniform (gray std {stddev:.1f})"
+        if is_page:
+            return None
+
+        # Share of pixels in each of 16 gray levels; levels holding under 1% are noise.
+        histogram = np.bincount((gray // 16).astype(np.int64).ravel(), minlength=16) / gray.size
+        levels = int((histogram >= 0.01).sum())
+        if levels <= self.max_gray_levels:
+            return f"near-monochrome ({levels} gray levels)"
+        return None
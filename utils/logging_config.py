@@ -1,35 +1,79 @@
-import tkinter as tk
 import logging
+import os
+import threading
+from collections import deque
 from datetime import datetime
+from logging.handlers import RotatingFileHandler
 
 class TextHandler(logging.Handler):
     """
     A custom logging handler that appends messages to a Tkinter Text widget.
-    Ensures thread-safe updates to the GUI widget.
+
+    Records from any thread are collected in a bounded ring buffer and written
+    to the widget in one batch every `flush_interval_ms`, on the Tk thread, so a
+    burst of log output costs one widget update instead of one per record. The
+    widget keeps at most `max_lines` lines; older lines are dropped from the top.
+    If more than `buffer_size` records arrive between two flushes, the oldest are
+    dropped and a note says how many; the log file, when configured, has them all.
+
+    The handler must be created on the Tk thread. Tkinter is only imported here, so
+    the headless commands, which use this module for console logging, also run on
+    Python builds without Tk.
     """
-    def __init__(self, text_widget):
+    def __init__(self, text_widget, max_lines=2000, flush_interval_ms=100, buffer_size=1000):
         logging.Handler.__init__(self)
         self.text_widget = text_widget
+        self.max_lines = max_lines
+        self.flush_interval_ms = flush_interval_ms
+        self.buffer = deque(maxlen=buffer_size)
+        self.buffer_lock = threading.Lock()
+        self.dropped = 0
+        self.text_widget.after(self.flush_interval_ms, self.flush_to_widget)
 
     def emit(self, record):
         """Emits a log record."""
-        msg = self.format(record)
-        
-        def append_to_widget():
-            """Appends the formatted message to the text widget."""
-            try:
+        try:
+            msg = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self.buffer_lock:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append(msg)
+
+    def flush_to_widget(self):
+        """Writes the buffered messages to the text widget and schedules the next flush."""
+        import tkinter as tk
+
+        with self.buffer_lock:
+            messages = list(self.buffer)
+            self.buffer.clear()
+            dropped, self.dropped = self.dropped, 0
+
+        try:
+            if messages:
+                if dropped:
+                    messages.insert(0, f"... {dropped} earlier message(s) not shown, see the log file ...")
                 self.text_widget.config(state=tk.NORMAL)
-                self.text_widget.insert(tk.END, msg + '\n')
+                self.text_widget.insert(tk.END, "\n".join(messages) + "\n")
+                # The widget always ends with an empty line after the last newline.
+                excess = int(self.text_widget.index("end-1c").split(".")[0]) - 1 - self.max_lines
+                if excess > 0:
+                    self.text_widget.delete("1.0", f"{excess + 1}.0")
                 self.text_widget.see(tk.END)
                 self.text_widget.config(state=tk.DISABLED)
-            except tk.TclError as e:
-                print(f"Tkinter error in TextHandler: {e}")
-
-        self.text_widget.after(0, append_to_widget)
+            self.text_widget.after(self.flush_interval_ms, self.flush_to_widget)
+        except tk.TclError as e:
+            # The widget has been destroyed; stop flushing.
+            print(f"Tkinter error in TextHandler: {e}")
 
-def setup_logging(text_widget):
+def setup_logging(text_widget, log_file=None, max_lines=2000, log_file_max_bytes=5 * 1024 * 1024,
+                  log_file_backups=3):
     """
-    Configures the root logger to use the custom TextHandler.
+    Configures the root logger to use the custom TextHandler and, when `log_file`
+    is given, to also keep the full log in a rotating file.
     """
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
@@ -37,7 +81,35 @@ def setup_logging(text_widget):
     if logger.hasHandlers():
         logger.handlers.clear()
 
-    handler = TextHandler(text_widget)
+    handler = TextHandler(text_widget, max_lines=max_lines)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%H:%M:%S')
+    handler.setFormatter(formatter)
+    
+    logger.addHandler(handler)
+
+    if log_file:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            file_handler = RotatingFileHandler(log_file, maxBytes=log_file_max_bytes,
+                                               backupCount=log_file_backups, encoding="utf-8")
+        except OSError as e:
+            print(f"Could not open the log file '{log_file}': {e}")
+        else:
+            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            logger.addHandler(file_handler)
+
+def setup_console_logging(level=logging.INFO):
+    """
+    Configures the root logger to write to the console, for headless runs
+    where there is no Tkinter log panel.
+    """
+    logger = logging.getLogger()
+    logger.setLevel(level)
+    
+    if logger.hasHandlers():
+        logger.handlers.clear()
+
+    handler = logging.StreamHandler()
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%H:%M:%S')
     handler.setFormatter(formatter)
     
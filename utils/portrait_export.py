@@ -0,0 +1,101 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from utils.file_naming import build_portrait_filename
+
+# Format name -> (file extension, PIL format).
+EXPORT_FORMATS = {
+    "jpeg": (".jpg", "JPEG"),
+    "webp": (".webp", "WEBP"),
+    "png": (".png", "PNG"),
+}
+
+def encode_portrait(portrait, fmt="jpeg", quality=95, thumbnail_size=None):
+    """
+    Encodes one portrait to bytes.
+
+    Args:
+        portrait (PIL.Image.Image): The portrait.
+        fmt (str): One of EXPORT_FORMATS.
+        quality (int): JPEG/WebP quality; ignored for PNG.
+        thumbnail_size (int): When set, the portrait is scaled and center-cropped
+                              to a square of this many pixels.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Choose one of: {', '.join(EXPORT_FORMATS)}.")
+
+    if thumbnail_size:
+        portrait = ImageOps.fit(portrait, (thumbnail_size, thumbnail_size), Image.LANCZOS)
+    if portrait.mode != "RGB":
+        portrait = portrait.convert("RGB")
+
+    save_kwargs = {}
+    if fmt in ("jpeg", "webp"):
+        save_kwargs["quality"] = quality
+    elif fmt == "png":
+        # Still lossless; the higher zlib levels cost several times the time for a few percent.
+        save_kwargs["compress_level"] = 1
+
+    buffer = io.BytesIO()
+    portrait.save(buffer, EXPORT_FORMATS[fmt][1], **save_kwargs)
+    return buffer.getvalue()
+
+def export_portraits(portraits, base_name, destination, fmt="jpeg", quality=95, thumbnail_size=None,
+                     as_zip=False, workers=None, progress=None):
+    """
+    Encodes every portrait in a thread pool and writes them to a folder, or
+    streams them into a single ZIP archive, named after the source file with the
+    `_img_extracted[N]` convention.
+
+    Args:
+        portraits (list): PIL Image objects, in order.
+        base_name (str): The source file name without its extension.
+        destination (str): The output folder, or the .zip path when `as_zip` is set.
+                           A ZIP can also be written to a binary file object.
+        fmt, quality, thumbnail_size: See encode_portrait.
+        as_zip (bool): Write one ZIP archive instead of separate files.
+        workers (int): Encoder threads. Defaults to the CPU count.
+        progress (callable): Called as progress(done, total) after each portrait.
+
+    Returns:
+        list: The written file paths, or a list holding the archive path.
+    """
+    extension = EXPORT_FORMATS[fmt][0] if fmt in EXPORT_FORMATS else None
+    total = len(portraits)
+    names = [build_portrait_filename(base_name, i, total, extension) for i in range(total)]
+    workers = max(1, workers or os.cpu_count() or 1)
+
+    def encode(portrait):
+        return encode_portrait(portrait, fmt, quality, thumbnail_size)
+
+    written = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # map() yields in input order while later portraits are still being encoded.
+        encoded = executor.map(encode, portraits)
+
+        if as_zip:
+            if isinstance(destination, str):
+                os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+            # The images are already compressed, so they are stored as they are.
+            with zipfile.ZipFile(destination, "w", compression=zipfile.ZIP_STORED) as archive:
+                for done, (name, data) in enumerate(zip(names, encoded), start=1):
+                    archive.writestr(name, data)
+                    if progress:
+                        progress(done, total)
+            written.append(destination)
+        else:
+            os.makedirs(destination, exist_ok=True)
+            for done, (name, data) in enumerate(zip(names, encoded), start=1):
+                path = os.path.join(destination, name)
+                with open(path, "wb") as f:
+                    f.write(data)
+                written.append(path)
+                if progress:
+                    progress(done, total)
+
+    return written